@@ -6,9 +6,10 @@
 import argparse
 import json
 import os
-import re
-import secrets
+import signal
 import sys
+import tempfile
+import time
 import typing
 import urllib.parse
 
@@ -16,23 +17,170 @@ from pathlib import Path
 
 import requests
 
+from portage.const import USER_CONFIG_PATH
+from portage.repository.config import RepoConfigLoader
+
 from gander import __version__
-from gander.privacy import PRIVACY_POLICY
-from gander.report import PortageAPI
+from gander.background import BackgroundMode
+from gander.binhost import BinhostAPI
+from gander.deadline import (Deadline,
+                             DeadlineExceeded,
+                             read_cached_report,
+                             write_cached_report,
+                             )
+from gander.forkserver import generate_reports
+from gander.image import ImageAPI
+from gander.privacy import (PRIVACY_POLICY,
+                            PRIVACY_POLICY_HASH,
+                            PRIVACY_POLICY_VERSION,
+                            POLICY_EXTENDED_FIELDS,
+                            )
+from gander.profiling import Profiler
+from gander.provision import (MACHINE_ID_RE,
+                              SYSTEM_MACHINE_ID_PATH,
+                              generate_machine_id,
+                              provision_roots,
+                              read_accepted_policy,
+                              read_machine_id,
+                              record_policy_acceptance,
+                              write_atomic,
+                              )
+from gander.report import EXTENDED_FIELDS, PortageAPI
+from gander.submission import (USER_AGENT,
+                               get_failure_hint,
+                               get_proxies,
+                               submit_reports,
+                               )
+from gander.vdbindex import (HookConflict,
+                             install_hook,
+                             rebuild_index,
+                             update_index,
+                             )
+from gander.watch import ReportWatcher, serve
 
 
 DEFAULT_ENDPOINT = 'https://anser.gentoo.org/submit'
 DEFAULT_TIMEOUT = 30
-MACHINE_ID_RE = re.compile(r'[0-9a-f]{32}')
+# policy version assumed for setups predating acceptance records
+DEFAULT_ACCEPTED_POLICY_VERSION = 1
+# exit status used when --deadline is exceeded
+DEADLINE_EXIT_STATUS = 3
+# max fraction of --deadline reserved for the submission
+SUBMIT_RESERVE = 0.25
+# concurrent requests used by --submit-batch unless --jobs is given
+DEFAULT_SUBMIT_JOBS = 8
 
 
-def make_report(args: argparse.Namespace) -> int:
-    api = PortageAPI(config_root=args.config_root)
-    data = {
+def positive_int(value: str) -> int:
+    """Parse a positive integer argument"""
+
+    try:
+        ret = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid int value: {value!r}')
+    if ret < 1:
+        raise argparse.ArgumentTypeError(
+            f'value must be a positive integer: {value!r}')
+    return ret
+
+
+def get_api(args: argparse.Namespace
+            ) -> typing.Union[BinhostAPI, ImageAPI, PortageAPI]:
+    if args.binhost_index is not None:
+        return BinhostAPI(args.binhost_index)
+    if args.config_root is not None and args.config_root.is_file():
+        return ImageAPI(args.config_root)
+    return PortageAPI(config_root=args.config_root, pacer=args.pacer,
+                      scan_jobs=args.scan_jobs)
+
+
+def get_extended_fields(args: argparse.Namespace,
+                        machine_id_path: Path,
+                        warn: bool = True
+                        ) -> typing.List[str]:
+    if not args.extended:
+        return []
+    version = read_accepted_policy(machine_id_path)
+    if version is None:
+        version = DEFAULT_ACCEPTED_POLICY_VERSION
+    allowed = POLICY_EXTENDED_FIELDS.get(version, frozenset())
+    if not allowed and warn:
+        print(f'Warning: Privacy Policy version {version} does not '
+              f'permit extended package data, --extended ignored',
+              file=sys.stderr)
+    # preserve the canonical field order
+    return [f for f in EXTENDED_FIELDS if f in allowed]
+
+
+def build_report(api: typing.Union[BinhostAPI, ImageAPI, PortageAPI],
+                 fields: typing.List[str]
+                 ) -> typing.Dict[str, typing.Any]:
+    world, details = api.get_world(fields)
+    data: typing.Dict[str, typing.Any] = {
         'goose-version': 1,
         'profile': api.profile,
-        'world': api.world,
+        'world': world,
     }
+    if fields:
+        data['world-details'] = details
+    return data
+
+
+def get_report_cache_key(args: argparse.Namespace,
+                         fields: typing.List[str]
+                         ) -> typing.Dict[str, typing.Any]:
+    def abspath(path: typing.Optional[Path]) -> typing.Optional[str]:
+        if path is None:
+            return None
+        return str(path.absolute())
+
+    return {
+        'config-root': abspath(args.config_root),
+        'binhost-index': abspath(args.binhost_index),
+        'fields': fields,
+    }
+
+
+def get_report_data(args: argparse.Namespace,
+                    deadline: Deadline,
+                    reserve: float = 0.0
+                    ) -> typing.Optional[typing.Dict[str, typing.Any]]:
+    fields = get_extended_fields(args, args.machine_id_path)
+    key = get_report_cache_key(args, fields)
+    try:
+        with deadline.phase('configuration', reserve):
+            api = get_api(args)
+        with deadline.phase('world resolution', reserve):
+            data = build_report(api, fields)
+    except DeadlineExceeded:
+        cached = read_cached_report(args.report_cache, key)
+        if cached is None:
+            print(f'Report generation exceeded the deadline '
+                  f'({deadline.summary()}), and no cached report '
+                  f'is available',
+                  file=sys.stderr)
+            return None
+        print(f'Warning: report generation exceeded the deadline '
+              f'({deadline.summary()}), using the cached report '
+              f'from {time.ctime(cached.timestamp)}',
+              file=sys.stderr)
+        return cached.report
+
+    # the cache is only used as a fallback for --deadline
+    if args.deadline is not None:
+        try:
+            write_cached_report(args.report_cache, key, data)
+        except OSError as e:
+            print(f'Warning: unable to update report cache: {e}',
+                  file=sys.stderr)
+    return data
+
+
+def make_report(args: argparse.Namespace) -> int:
+    deadline = Deadline(args.deadline)
+    data = get_report_data(args, deadline)
+    if data is None:
+        return DEADLINE_EXIT_STATUS
 
     try:
         with open(args.machine_id_path, 'r') as f:
@@ -54,13 +202,46 @@ def make_report(args: argparse.Namespace) -> int:
     return 0
 
 
+def watch(args: argparse.Namespace) -> int:
+    if args.binhost_index is not None or (
+            args.config_root is not None and args.config_root.is_file()):
+        print('--watch can only be used with an installed system',
+              file=sys.stderr)
+        return 1
+
+    def get_report(watcher: ReportWatcher) -> typing.Dict[str, typing.Any]:
+        data: typing.Dict[str, typing.Any] = {
+            'goose-version': 1,
+            'profile': watcher.profile,
+            'world': watcher.world,
+        }
+        machine_id = read_machine_id(args.machine_id_path)
+        if machine_id is not None:
+            data['id'] = machine_id
+        return data
+
+    def terminate(signum: int, frame: typing.Any) -> None:
+        raise KeyboardInterrupt()
+
+    signal.signal(signal.SIGTERM, terminate)
+    watcher = ReportWatcher(config_root=args.config_root)
+    try:
+        serve(watcher, args.socket, get_report)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
 def privacy_policy(args: argparse.Namespace) -> int:
     print(PRIVACY_POLICY)
+    print()
+    print(f'Policy version: {PRIVACY_POLICY_VERSION}')
+    print(f'Policy SHA256: {PRIVACY_POLICY_HASH}')
     return 0
 
 
 def get_default_machine_id_path() -> Path:
-    machine_id_path = Path('/etc/gander.id')
+    machine_id_path = SYSTEM_MACHINE_ID_PATH
     if not os.access(machine_id_path, os.W_OK):
         machine_id_path = (Path(os.environ.get('XDG_CONFIG_HOME',
                                                Path.home() / '.config'))
@@ -68,29 +249,125 @@ def get_default_machine_id_path() -> Path:
     return machine_id_path
 
 
+def get_root_machine_id_path(root: Path) -> Path:
+    return root / SYSTEM_MACHINE_ID_PATH.relative_to('/')
+
+
+def make_reports(args: argparse.Namespace) -> int:
+    if args.roots is None:
+        print('--make-reports requires --roots', file=sys.stderr)
+        return 1
+
+    def report_func(root: Path,
+                    repositories: typing.Optional[RepoConfigLoader]
+                    ) -> typing.Dict[str, typing.Any]:
+        machine_id_path = get_root_machine_id_path(root)
+        api = PortageAPI(config_root=root, repositories=repositories,
+                         pacer=args.pacer, scan_jobs=args.scan_jobs)
+        data = build_report(
+            api, get_extended_fields(args, machine_id_path, warn=False))
+        machine_id = read_machine_id(machine_id_path)
+        if machine_id is not None:
+            data['id'] = machine_id
+        return data
+
+    template_root = args.config_root
+    if template_root is not None and template_root.is_file():
+        template_root = None
+
+    ret = 0
+    for result in generate_reports(list(read_roots(args)),
+                                   report_func,
+                                   template_root=template_root,
+                                   jobs=args.jobs,
+                                   pacer=args.pacer):
+        if result.report is None:
+            ret = 1
+            print(f'{result.root}: {result.error}', file=sys.stderr)
+            continue
+        if 'id' not in result.report and not args.quiet:
+            print(f'Warning: {result.root}: no valid machine-id, '
+                  f'the report will not be suitable for submission',
+                  file=sys.stderr)
+        json.dump(result.report, sys.stdout)
+        print()
+    return ret
+
+
+def get_default_report_cache_path() -> Path:
+    if os.access('/var/cache', os.W_OK):
+        return Path('/var/cache/gander/report.json')
+    return (Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache'))
+            / 'gander-report.json')
+
+
+def get_default_socket_path() -> Path:
+    if os.access('/run', os.W_OK):
+        return Path('/run/gander.sock')
+    return (Path(os.environ.get('XDG_RUNTIME_DIR', tempfile.gettempdir()))
+            / 'gander.sock')
+
+
+def read_roots(args: argparse.Namespace) -> typing.Iterator[Path]:
+    if args.roots == '-':
+        f = sys.stdin
+    else:
+        f = open(args.roots, 'r')
+    with f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield Path(args.root_format.format(line))
+
+
+def setup_roots(args: argparse.Namespace) -> int:
+    ret = 0
+    for result in provision_roots(read_roots(args)):
+        if result.machine_id is None:
+            ret = 1
+            print(f'{result.root}: {result.status}', file=sys.stderr)
+        elif not args.quiet:
+            print(f'{result.root}: {result.machine_id} {result.status}')
+    return ret
+
+
 def setup(args: argparse.Namespace) -> int:
-    print(PRIVACY_POLICY)
-    print()
-    while True:
-        try:
-            resp = input('Do you accept the terms of the Privacy '
-                         'Policy? [Y/n] ')
-            if not resp or resp.lower() == 'y':
-                break
-            elif resp.lower() == 'n':
-                return 1
-            else:
-                print('Please answer Y or N.')
-        except KeyboardInterrupt:
-            print()
+    if args.accept_policy is not None:
+        if args.accept_policy not in (str(PRIVACY_POLICY_VERSION),
+                                      PRIVACY_POLICY_HASH):
+            print(f'The Privacy Policy (version {PRIVACY_POLICY_VERSION}, '
+                  f'SHA256 {PRIVACY_POLICY_HASH}) does not match '
+                  f'--accept-policy, please review it using '
+                  f'--privacy-policy',
+                  file=sys.stderr)
             return 1
+    elif args.roots is not None:
+        print('--setup --roots requires --accept-policy',
+              file=sys.stderr)
+        return 1
+    else:
+        print(PRIVACY_POLICY)
+        print()
+        while True:
+            try:
+                resp = input('Do you accept the terms of the Privacy '
+                             'Policy? [Y/n] ')
+                if not resp or resp.lower() == 'y':
+                    break
+                elif resp.lower() == 'n':
+                    return 1
+                else:
+                    print('Please answer Y or N.')
+            except KeyboardInterrupt:
+                print()
+                return 1
+
+    if args.roots is not None:
+        return setup_roots(args)
 
-    # NB: we don't really need cryptographic security but the 'secrets'
-    # module is convenient to use
-    sysid = secrets.token_hex(16)
-    os.makedirs(args.machine_id_path.parent, exist_ok=True)
-    with open(args.machine_id_path, 'w') as f:
-        f.write(f'{sysid}\n')
+    sysid = generate_machine_id()
+    write_atomic(args.machine_id_path, f'{sysid}\n')
+    record_policy_acceptance(args.machine_id_path)
     print(f'Machine id: {sysid},\nwritten to {args.machine_id_path}')
 
     # TODO: set up a cronjob
@@ -98,7 +375,43 @@ def setup(args: argparse.Namespace) -> int:
     return 0
 
 
+def setup_hook(args: argparse.Namespace) -> int:
+    if args.roots is not None:
+        print('--install-hook does not support --roots, please install '
+              'the hook for every root separately using --config-root',
+              file=sys.stderr)
+        return 1
+
+    bashrc = Path(args.config_root or '/') / USER_CONFIG_PATH / 'bashrc'
+    try:
+        install_hook(bashrc)
+    except HookConflict as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f'vdb index hook installed into {bashrc}')
+
+    eroot = PortageAPI(config_root=args.config_root).eroot
+    index = rebuild_index(eroot)
+    print(f'vdb index of {len(index.packages)} packages written '
+          f'for {eroot}')
+    return 0
+
+
+def update_vdb_index(args: argparse.Namespace) -> int:
+    if args.cpv is None:
+        print('--update-vdb-index requires --cpv', file=sys.stderr)
+        return 1
+    try:
+        update_index(args.eroot, args.cpv,
+                     removed=args.removed)
+    except OSError as e:
+        print(f'Unable to update vdb index: {e}', file=sys.stderr)
+        return 1
+    return 0
+
+
 def submit(args: argparse.Namespace) -> int:
+    deadline = Deadline(args.deadline)
     try:
         with open(args.machine_id_path, 'r') as f:
             machine_id = f.read().strip()
@@ -110,30 +423,36 @@ def submit(args: argparse.Namespace) -> int:
               file=sys.stderr)
         return 1
 
-    api = PortageAPI(config_root=args.config_root)
-    data = {
-        'goose-version': 1,
-        'id': machine_id,
-        'profile': api.profile,
-        'world': api.world,
-    }
-
-    if args.tor:
-        route = secrets.token_hex(2)
-        proxies = {
-            # TODO: guess and use 127.0.0.1 / ::1 instead?
-            args.api_endpoint.scheme:
-                f'socks5h://gander{route}@localhost:9050',
-        }
-    else:
-        proxies = {}
+    # leave part of the budget for submitting the (possibly cached)
+    # report
+    reserve = 0.0
+    if args.deadline is not None:
+        reserve = min(args.timeout, args.deadline * SUBMIT_RESERVE)
+    data = get_report_data(args, deadline, reserve)
+    if data is None:
+        return DEADLINE_EXIT_STATUS
+    data['id'] = machine_id
+
+    proxies = get_proxies(args.api_endpoint.scheme, args.tor)
+    timeout: float = args.timeout
+    remaining = deadline.remaining()
+    if remaining is not None:
+        timeout = min(timeout, remaining)
 
     try:
-        resp = requests.put(args.api_endpoint.geturl(),
-                            headers={'User-Agent': 'gander'},
-                            json=data,
-                            proxies=proxies,
-                            timeout=args.timeout)
+        # the alarm also covers name resolution that is not subject
+        # to the requests timeout
+        with deadline.phase('submission'):
+            resp = requests.put(args.api_endpoint.geturl(),
+                                headers={'User-Agent': USER_AGENT},
+                                json=data,
+                                proxies=proxies,
+                                timeout=timeout)
+    except DeadlineExceeded:
+        if not args.no_messages:
+            print(f'Report submission exceeded the deadline '
+                  f'({deadline.summary()})')
+        return DEADLINE_EXIT_STATUS
     except (requests.ConnectionError, requests.Timeout) as e:
         if not args.no_messages:
             print(f'Report submission failed:\n{e}')
@@ -149,29 +468,70 @@ def submit(args: argparse.Namespace) -> int:
             print(f'The server replied ({resp.status_code}):')
             print(resp.text)
             print('Submission failed.')
-            if resp.status_code >= 500 and resp.status_code < 600:
-                print('The server seems to be having trouble, please '
-                      'try again later.')
-            elif resp.status_code == 429:
-                print('Please wait 7 days between successive '
-                      'submissions.')
-            elif resp.status_code == 413:
-                rep_mib = len(json.dumps(data)) / 1024 / 1024
-                print(f'The report ({rep_mib:.2f} MiB) seems to have '
-                      f'exceeded server-defined request size limit.')
-                print('Please file a bug at https://bugs.gentoo.org/, '
-                      'asking Gentoo Infra to increase the limit.')
-            elif resp.status_code == 404:
-                print('Did you specify a correct API endpoint URL?')
+            hint = get_failure_hint(resp.status_code, data)
+            if hint is not None:
+                print(hint)
         return 1
 
 
+def submit_batch(args: argparse.Namespace) -> int:
+    if args.reports is None:
+        print('--submit-batch requires --reports', file=sys.stderr)
+        return 1
+    if args.reports == '-':
+        f = sys.stdin
+    else:
+        f = open(args.reports, 'r')
+
+    ret = 0
+    with f:
+        for result in submit_reports(
+                args.api_endpoint.geturl(),
+                f,
+                jobs=(args.jobs if args.jobs is not None
+                      else DEFAULT_SUBMIT_JOBS),
+                tor=args.tor,
+                timeout=args.timeout):
+            if not result.accepted:
+                ret = 1
+            elif args.quiet:
+                continue
+            if args.no_messages:
+                continue
+            status = ('' if result.status_code is None
+                      else f' ({result.status_code})')
+            print(f'{result.lineno}: {result.machine_id or "-"}: '
+                  f'{result.message}{status}')
+    return ret
+
+
+def run_action(args: argparse.Namespace) -> int:
+    if args.profile_out is None:
+        return args.action(args)
+
+    profiler = Profiler()
+    try:
+        with profiler:
+            return args.action(args)
+    finally:
+        paths = profiler.write(args.profile_out)
+        print(f'Profile written to {", ".join(str(p) for p in paths)}',
+              file=sys.stderr)
+        print(f'Profile summary: {profiler.summary()}', file=sys.stderr)
+
+
 def main(argv: typing.List[str]) -> int:
     argp = argparse.ArgumentParser()
     argp.add_argument('--version',
                       action='version',
                       version=f'gander {__version__}',
                       help='print the program version and exit')
+    argp.add_argument('--profile-out',
+                      type=Path,
+                      metavar='PATH',
+                      help='profile the action, and write cProfile data '
+                           'to PATH.pstats and sampled stacks to '
+                           'PATH.folded (for flamegraph.pl)')
 
     xgroup = (argp.add_argument_group('action')
               .add_mutually_exclusive_group(required=True))
@@ -190,17 +550,137 @@ def main(argv: typing.List[str]) -> int:
                         const=setup,
                         dest='action',
                         help='set gander up for submitting reports')
+    xgroup.add_argument('--install-hook',
+                        action='store_const',
+                        const=setup_hook,
+                        dest='action',
+                        help='install a Portage hook into /etc/portage/'
+                             'bashrc (relative to --config-root) keeping '
+                             'an index of installed packages up to date, '
+                             'to speed up report generation')
     xgroup.add_argument('--submit',
                         action='store_const',
                         const=submit,
                         dest='action',
                         help='generate and submit report')
+    xgroup.add_argument('--submit-batch',
+                        action='store_const',
+                        const=submit_batch,
+                        dest='action',
+                        help='submit pre-generated reports listed '
+                             'in --reports concurrently')
+    xgroup.add_argument('--update-vdb-index',
+                        action='store_const',
+                        const=update_vdb_index,
+                        dest='action',
+                        help='update the vdb index after --cpv has been '
+                             'merged (or unmerged, with --removed); '
+                             'used by the Portage hook')
+    xgroup.add_argument('--make-reports',
+                        action='store_const',
+                        const=make_reports,
+                        dest='action',
+                        help='create reports for all system roots listed '
+                             'in --roots and output them as JSON lines')
+    xgroup.add_argument('--watch',
+                        action='store_const',
+                        const=watch,
+                        dest='action',
+                        help='keep the report up to date and serve it '
+                             'over a unix socket')
 
     group = argp.add_argument_group('report options')
     group.add_argument('--config-root',
                        type=Path,
                        help='system root path relative to which '
-                            'configuration files are loaded')
+                            'configuration files are loaded, or path '
+                            'to a tarball or squashfs image')
+    group.add_argument('--binhost-index',
+                       type=Path,
+                       help='generate the report from binary package '
+                            'index (Packages file) instead of installed '
+                            'packages')
+    group.add_argument('--extended',
+                       action='store_true',
+                       help='include extended package data (versions, '
+                            'slots, USE flags) if permitted by '
+                            'the Privacy Policy')
+    group.add_argument('--scan-jobs',
+                       type=positive_int,
+                       metavar='N',
+                       help='read the vdb directly using N parallel '
+                            'threads (speeds up roots on network '
+                            'filesystems)')
+    group.add_argument('--background',
+                       action='store_true',
+                       help='minimize the impact on other processes: '
+                            'lower CPU priority (nice, SCHED_IDLE) and I/O '
+                            'priority (idle class), and pace vdb reads '
+                            '(report generation is slower)')
+    group.add_argument('--deadline',
+                       type=float,
+                       metavar='SECONDS',
+                       help=f'abort report generation and submission '
+                            f'if they take longer than SECONDS; use '
+                            f'the last good report from --report-cache '
+                            f'if available, otherwise exit with status '
+                            f'{DEADLINE_EXIT_STATUS}')
+    report_cache = get_default_report_cache_path()
+    group.add_argument('--report-cache',
+                       type=Path,
+                       default=report_cache,
+                       help=f'path to the last good report cache, updated '
+                            f'by runs using --deadline '
+                            f'(default: {report_cache})')
+
+    group = argp.add_argument_group('setup options')
+    group.add_argument('--accept-policy',
+                       metavar='VERSION|SHA256',
+                       help='accept the Privacy Policy non-interactively, '
+                            'provided that its version or SHA256 hash '
+                            'matches the value (see --privacy-policy)')
+
+    group = argp.add_argument_group('multiple root options')
+    group.add_argument('--roots',
+                       metavar='FILE',
+                       help='operate on all system roots listed in FILE '
+                            '(one per line, - for stdin) instead of '
+                            'the local system; used by --setup '
+                            '(requires --accept-policy) and '
+                            '--make-reports')
+    group.add_argument('--root-format',
+                       default='{}',
+                       help='format used to transform --roots entries '
+                            'into paths, e.g. "/var/lib/machines/{}" '
+                            'for container names (default: {})')
+    group.add_argument('-j', '--jobs',
+                       type=positive_int,
+                       help=f'number of reports generated (default: '
+                            f'number of CPUs) or submitted (default: '
+                            f'{DEFAULT_SUBMIT_JOBS}) in parallel; '
+                            f'--config-root specifies the root whose '
+                            f'repository configuration is preloaded '
+                            f'and shared')
+
+    group = argp.add_argument_group('vdb index options')
+    group.add_argument('--cpv',
+                       help='package whose vdb index entry is updated')
+    group.add_argument('--eroot',
+                       type=Path,
+                       default=Path('/'),
+                       help='effective root of the system whose vdb '
+                            'index is updated (default: /)')
+    group.add_argument('--removed',
+                       action='store_true',
+                       help='remove the package from the vdb index')
+
+    group = argp.add_argument_group('watch options')
+    socket_path = get_default_socket_path()
+    group.add_argument('--socket',
+                       type=Path,
+                       default=socket_path,
+                       help=f'path to the unix socket serving the report '
+                            f'(default: {socket_path})')
 
     group = argp.add_argument_group('submission options')
     machine_id_path = get_default_machine_id_path()
@@ -221,6 +701,11 @@ def main(argv: typing.List[str]) -> int:
     group.add_argument('-s', '--no-messages',
                        action='store_true',
                        help='disable all output, including failures')
+    group.add_argument('--reports',
+                       metavar='FILE',
+                       help='file containing reports for --submit-batch '
+                            '(JSON lines, e.g. from --make-reports; '
+                            '- for stdin)')
     group.add_argument('--timeout',
                        type=int,
                        default=DEFAULT_TIMEOUT,
@@ -232,7 +717,19 @@ def main(argv: typing.List[str]) -> int:
                             'the connection (must be running on :9050')
 
     args = argp.parse_args(argv)
-    return args.action(args)
+    if not args.background:
+        args.pacer = None
+        return run_action(args)
+
+    background = BackgroundMode()
+    background.enter()
+    args.pacer = background.pacer
+    try:
+        return run_action(args)
+    finally:
+        if not args.quiet and not args.no_messages:
+            print(f'Background mode: {background.summary()}',
+                  file=sys.stderr)
 
 
 def setuptools_main() -> None:
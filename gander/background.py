@@ -0,0 +1,125 @@
+# (c) 2020 Michał Górny
+# 2-clause BSD license
+
+"""Low-impact background mode"""
+
+import ctypes
+import ctypes.util
+import os
+import platform
+import time
+import typing
+
+
+# __NR_ioprio_set per architecture (platform.machine())
+IOPRIO_SET_SYSCALLS = {
+    'x86_64': 251,
+    'i386': 289,
+    'i486': 289,
+    'i586': 289,
+    'i686': 289,
+    'aarch64': 30,
+    'armv6l': 314,
+    'armv7l': 314,
+    'riscv64': 30,
+    'loongarch64': 30,
+    'ppc': 273,
+    'ppc64': 273,
+    'ppc64le': 273,
+    's390x': 282,
+    'sparc64': 196,
+    'alpha': 442,
+    'parisc': 267,
+    'parisc64': 267,
+}
+
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+
+# fraction of wall clock time spent working when pacing
+DEFAULT_DUTY_CYCLE = 0.25
+
+
+class Pacer(object):
+    """Duty cycle limiter for report generation loops"""
+
+    def __init__(self,
+                 duty_cycle: float = DEFAULT_DUTY_CYCLE,
+                 min_sleep: float = 0.01
+                 ) -> None:
+        """
+        Instantiate the pacer
+
+        Call the instance after every unit of work (e.g. resolving
+        a single atom).  The pacer sleeps so that the time spent
+        working since the previous call takes up at most `duty_cycle`
+        of the wall clock time.  Sleeps shorter than `min_sleep` are
+        accumulated rather than done immediately.
+        """
+
+        self.duty_cycle = duty_cycle
+        self.min_sleep = min_sleep
+        self.last = time.monotonic()
+        self.debt = 0.0
+        self.steps = 0
+        self.throttled = 0.0
+
+    def start(self) -> None:
+        """Start pacing from now, discarding the pending sleep"""
+
+        self.last = time.monotonic()
+        self.debt = 0.0
+
+    def __call__(self) -> None:
+        busy = time.monotonic() - self.last
+        self.debt += busy * (1 - self.duty_cycle) / self.duty_cycle
+        self.steps += 1
+        if self.debt >= self.min_sleep:
+            time.sleep(self.debt)
+            self.throttled += self.debt
+            self.debt = 0.0
+        self.last = time.monotonic()
+
+
+def set_idle_io_priority() -> bool:
+    """Set idle I/O scheduling class via ioprio_set(2)"""
+
+    nr = IOPRIO_SET_SYSCALLS.get(platform.machine())
+    if nr is None:
+        return False
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    return libc.syscall(nr, IOPRIO_WHO_PROCESS, 0,
+                        IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT) == 0
+
+
+class BackgroundMode(object):
+    """Reduced CPU and I/O priority for the current process"""
+
+    def __init__(self,
+                 duty_cycle: float = DEFAULT_DUTY_CYCLE
+                 ) -> None:
+        self.pacer = Pacer(duty_cycle)
+        self.applied: typing.List[str] = []
+
+    def enter(self) -> None:
+        """Lower the priorities of the current process"""
+
+        os.nice(19 - os.nice(0))
+        self.applied.append('nice 19')
+        if hasattr(os, 'SCHED_IDLE'):
+            try:
+                os.sched_setscheduler(0, os.SCHED_IDLE, os.sched_param(0))
+                self.applied.append('SCHED_IDLE')
+            except OSError:
+                pass
+        if set_idle_io_priority():
+            self.applied.append('idle I/O class')
+
+    def summary(self) -> str:
+        """Get human-readable summary of the throttling applied"""
+
+        priorities = ', '.join(self.applied) or 'none'
+        return (f'priorities: {priorities}; throttled for '
+                f'{self.pacer.throttled:.2f} s over {self.pacer.steps} '
+                f'steps ({self.pacer.duty_cycle:.0%} duty cycle)')
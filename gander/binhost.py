@@ -0,0 +1,140 @@
+# (c) 2020 Michał Górny
+# 2-clause BSD license
+
+"""Report generation from binary package index (Packages) files"""
+
+import mmap
+import typing
+
+from pathlib import Path, PurePosixPath
+
+from portage.exception import InvalidData
+from portage.versions import _pkg_str
+
+from gander.report import WorldDetails, is_gentoo_repo, world_details
+
+
+# keys inherited by package entries from the index header
+INHERITED_KEYS = ('CHOST', 'REPO')
+# package entry keys retained for the report
+PACKAGE_KEYS = ('CPV', 'REPO', 'SLOT', 'USE')
+
+
+def iter_stanzas(buf: typing.Union[mmap.mmap, typing.BinaryIO]
+                 ) -> typing.Iterator[typing.Dict[str, str]]:
+    """
+    Iterate over stanzas of a Packages index
+
+    Read `key: value` lines from `buf` and yield a dict for every
+    stanza, i.e. block of lines delimited by an empty line.  The first
+    stanza yielded is the index header.  Lines not conforming
+    to the format are ignored.
+    """
+
+    stanza: typing.Dict[str, str] = {}
+    for line in iter(buf.readline, b''):
+        line = line.rstrip(b'\r\n')
+        if not line:
+            if stanza:
+                yield stanza
+                stanza = {}
+            continue
+        k, sep, v = line.decode('utf-8', errors='replace').partition(':')
+        if sep:
+            stanza[k] = v.lstrip()
+    if stanza:
+        yield stanza
+
+
+class BinhostAPI(object):
+    """Binary package index wrapper"""
+
+    def __init__(self,
+                 path: Path
+                 ) -> None:
+        """
+        Instantiate a new instance and load the index
+
+        Read the Packages index at `path`, streaming through it once.
+        Only the index header and the fields needed for the report
+        are retained in memory.
+        """
+
+        self.header: typing.Dict[str, str] = {}
+        self.packages: typing.List[typing.Dict[str, str]] = []
+
+        with open(path, 'rb') as f:
+            try:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty file, cannot be mmapped
+                return
+            with buf:
+                stanzas = iter_stanzas(buf)
+                self.header = next(stanzas, {})
+                for d in stanzas:
+                    if 'CPV' not in d:
+                        continue
+                    for k in INHERITED_KEYS:
+                        v = self.header.get(k)
+                        if v:
+                            d.setdefault(k, v)
+                    self.packages.append(
+                        {k: d[k] for k in PACKAGE_KEYS if k in d})
+
+    @property
+    def profile(self) -> typing.Optional[str]:
+        """
+        Profile used to build the packages
+
+        Get the profile recorded in the index header.  Return None
+        if the index does not specify it, or if it is not relative
+        to the Gentoo repository.
+        """
+
+        profile = self.header.get('PROFILE')
+        if not profile:
+            return None
+        path = PurePosixPath(profile)
+        if path.is_absolute() or '..' in path.parts:
+            return None
+        return str(path)
+
+    def get_world(self,
+                  fields: typing.Collection[str] = ()
+                  ) -> typing.Tuple[typing.List[str], WorldDetails]:
+        """
+        Packages built on the binhost, with extended data
+
+        Get the list of packages as returned by world, along with
+        extended `fields` for every package in the index.
+        """
+
+        ret = set()
+        matches = []
+        for d in self.packages:
+            if not is_gentoo_repo(d.get('REPO')):
+                # skip packages from other repositories
+                continue
+            try:
+                pkg = _pkg_str(d['CPV'])
+            except InvalidData:
+                # skip malformed entries
+                continue
+            ret.add(pkg.cp)
+            if fields:
+                # SLOT is omitted from the index if it has default value
+                matches.append((pkg, {'SLOT': '0', **d}))
+        return sorted(ret), world_details(matches, fields)
+
+    @property
+    def world(self) -> typing.List[str]:
+        """
+        Packages built on the binhost
+
+        Get the list of all packages present in the index, filtered
+        to the packages built from the Gentoo repository.  They are
+        returned as plain package names.
+        """
+
+        return self.get_world()[0]
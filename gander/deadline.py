@@ -0,0 +1,155 @@
+# (c) 2020 Michał Górny
+# 2-clause BSD license
+
+"""Deadline-bounded report generation"""
+
+import contextlib
+import json
+import signal
+import time
+import typing
+
+from pathlib import Path
+
+from gander.provision import write_atomic
+
+
+REPORT_CACHE_VERSION = 1
+
+
+class DeadlineExceeded(BaseException):
+    """Time budget exceeded"""
+
+    # NB: derived from BaseException (like KeyboardInterrupt) so that
+    # it is not swallowed by 'except Exception' blocks in Portage
+    pass
+
+
+class PhaseTiming(typing.NamedTuple):
+    name: str
+    duration: float
+    interrupted: bool
+
+
+class Deadline(object):
+    """Time budget for a sequence of phases"""
+
+    def __init__(self, seconds: typing.Optional[float]) -> None:
+        """
+        Start the time budget
+
+        `seconds` specifies the total budget, counted from now.  If it
+        is None, the time is unlimited and only phase timings
+        are recorded.
+        """
+
+        self.seconds = seconds
+        self.start = time.monotonic()
+        self.phases: typing.List[PhaseTiming] = []
+
+    @property
+    def elapsed(self) -> float:
+        """Time elapsed since start"""
+
+        return time.monotonic() - self.start
+
+    def remaining(self) -> typing.Optional[float]:
+        """Time remaining in the budget, or None if unlimited"""
+
+        if self.seconds is None:
+            return None
+        return max(self.seconds - self.elapsed, 0.0)
+
+    @contextlib.contextmanager
+    def phase(self,
+              name: str,
+              reserve: float = 0.0
+              ) -> typing.Iterator[None]:
+        """
+        Run a phase bounded by the deadline
+
+        Arm SIGALRM to raise DeadlineExceeded when less than `reserve`
+        seconds remain in the budget, and record the phase timing
+        as `name`.  Must be called from the main thread.
+        """
+
+        def alarm(signum: int, frame: typing.Any) -> None:
+            raise DeadlineExceeded()
+
+        start = time.monotonic()
+        remaining = self.remaining()
+        armed = False
+        interrupted = False
+        try:
+            if remaining is not None:
+                if remaining <= reserve:
+                    raise DeadlineExceeded()
+                old_handler = signal.signal(signal.SIGALRM, alarm)
+                armed = True
+                signal.setitimer(signal.ITIMER_REAL, remaining - reserve)
+            yield
+        except DeadlineExceeded:
+            interrupted = True
+            raise
+        finally:
+            if armed:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                signal.signal(signal.SIGALRM, old_handler)
+            self.phases.append(
+                PhaseTiming(name, time.monotonic() - start, interrupted))
+
+    def summary(self) -> str:
+        """Get human-readable timing summary"""
+
+        phases = ', '.join(
+            f'{p.name} {p.duration:.2f} s'
+            + (' (interrupted)' if p.interrupted else '')
+            for p in self.phases)
+        if self.seconds is not None:
+            ret = (f'deadline of {self.seconds:.2f} s, '
+                   f'{self.elapsed:.2f} s elapsed')
+        else:
+            ret = f'{self.elapsed:.2f} s elapsed'
+        if phases:
+            ret += f': {phases}'
+        return ret
+
+
+class CachedReport(typing.NamedTuple):
+    report: typing.Dict[str, typing.Any]
+    timestamp: float
+
+
+def read_cached_report(path: Path,
+                       key: typing.Dict[str, typing.Any]
+                       ) -> typing.Optional[CachedReport]:
+    """
+    Read last good report from cache at `path`
+
+    Return the cached report, or None if the cache is missing, invalid
+    or it was generated for different options than `key`.
+    """
+
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+        if (data['version'] != REPORT_CACHE_VERSION
+                or data['key'] != key):
+            return None
+        return CachedReport(data['report'], float(data['timestamp']))
+    except (OSError, ValueError, TypeError, KeyError):
+        return None
+
+
+def write_cached_report(path: Path,
+                        key: typing.Dict[str, typing.Any],
+                        report: typing.Dict[str, typing.Any]
+                        ) -> None:
+    """Store `report` generated for options `key` in cache at `path`"""
+
+    write_atomic(path, json.dumps({
+        'version': REPORT_CACHE_VERSION,
+        'key': key,
+        'timestamp': time.time(),
+        'report': report,
+    }))
@@ -0,0 +1,131 @@
+# (c) 2020 Michał Górny
+# 2-clause BSD license
+
+"""Batch report generation using forked workers"""
+
+import hashlib
+import multiprocessing
+import os
+import typing
+
+from pathlib import Path
+
+from portage.const import USER_CONFIG_PATH
+from portage.repository.config import RepoConfigLoader
+
+from gander.background import Pacer
+from gander.report import PortageAPI
+
+
+ReportFunc = typing.Callable[[Path, typing.Optional[RepoConfigLoader]],
+                             typing.Dict[str, typing.Any]]
+
+
+class BatchResult(typing.NamedTuple):
+    root: Path
+    report: typing.Optional[typing.Dict[str, typing.Any]]
+    error: typing.Optional[str]
+    # pacer statistics of the worker
+    steps: int = 0
+    throttled: float = 0.0
+
+
+# state preloaded in the parent and shared copy-on-write with workers
+_template: typing.Optional[PortageAPI] = None
+_template_key: typing.Optional[bytes] = None
+_report_func: typing.Optional[ReportFunc] = None
+_pacer: typing.Optional[Pacer] = None
+
+
+def config_files(path: Path) -> typing.List[Path]:
+    """List files of a Portage config that can be a file or directory"""
+
+    if path.is_dir():
+        return sorted(p for p in path.iterdir()
+                      if p.is_file() and not p.name.startswith('.')
+                      and not p.name.endswith('~'))
+    if path.is_file():
+        return [path]
+    return []
+
+
+def repos_conf_key(config_root: typing.Optional[Path]) -> bytes:
+    """
+    Get key identifying repository configuration of a root
+
+    Hash the files that can affect repository configuration in
+    `config_root`: repos.conf, and PORTDIR* assignments in make.conf.
+    Roots with identical keys can share the same repository
+    configuration.
+    """
+
+    h = hashlib.sha256()
+    h.update(os.environ.get('PORTAGE_REPOSITORIES', '').encode())
+    etcport = Path(config_root or '/') / USER_CONFIG_PATH
+    for f in config_files(etcport / 'repos.conf'):
+        h.update(f.name.encode() + b'\0' + f.read_bytes() + b'\0')
+    for f in config_files(etcport / 'make.conf'):
+        for line in f.read_bytes().splitlines():
+            if b'PORTDIR' in line:
+                h.update(line + b'\0')
+    return h.digest()
+
+
+def _worker(root: Path) -> BatchResult:
+    assert _report_func is not None
+    if _pacer is not None:
+        # the worker's copy of the pacer counts only this root
+        _pacer.steps = 0
+        _pacer.throttled = 0.0
+    try:
+        repositories = None
+        if _template is not None and repos_conf_key(root) == _template_key:
+            repositories = _template.repositories
+        result = BatchResult(root, _report_func(root, repositories), None)
+    except Exception as e:
+        result = BatchResult(root, None, f'{type(e).__name__}: {e}')
+    if _pacer is not None:
+        result = result._replace(steps=_pacer.steps,
+                                 throttled=_pacer.throttled)
+    return result
+
+
+def generate_reports(roots: typing.Iterable[Path],
+                     report_func: ReportFunc,
+                     template_root: typing.Optional[Path] = None,
+                     jobs: typing.Optional[int] = None,
+                     pacer: typing.Optional[Pacer] = None
+                     ) -> typing.Iterator[BatchResult]:
+    """
+    Generate reports for multiple roots
+
+    Load Portage and the repository configuration of `template_root`
+    once, then fork a fresh worker for every root in `roots`, running
+    up to `jobs` of them in parallel.  `report_func` is called in the
+    worker with the root and the preloaded repository configuration
+    (or None if the root's configuration differs from the template),
+    and returns the report.  Yield results in the order of `roots`.
+
+    If `report_func` throttles the workers using `pacer`, their
+    throttling statistics are added to it as results are received.
+    """
+
+    global _template, _template_key, _report_func, _pacer
+
+    try:
+        _template = PortageAPI(config_root=template_root)
+        _template_key = repos_conf_key(template_root)
+    except Exception:
+        # no usable template, load everything in workers
+        _template = None
+    _report_func = report_func
+    _pacer = pacer
+
+    ctx = multiprocessing.get_context('fork')
+    # maxtasksperchild=1 gives every root a pristine fork of the parent
+    with ctx.Pool(jobs, maxtasksperchild=1) as pool:
+        for result in pool.imap(_worker, roots):
+            if pacer is not None:
+                pacer.steps += result.steps
+                pacer.throttled += result.throttled
+            yield result
@@ -0,0 +1,348 @@
+# (c) 2020 Michał Górny
+# 2-clause BSD license
+
+"""Report generation from system images and tarballs"""
+
+import posixpath
+import re
+import tarfile
+import typing
+
+from pathlib import Path, PurePosixPath
+
+from portage.dep import Atom
+from portage.exception import InvalidAtom, InvalidData
+from portage.versions import _pkg_str, _unknown_repo
+
+from gander.report import WorldDetails, match_world, world_details
+from gander.vdbscan import normalize_slot
+
+
+SQUASHFS_MAGIC = b'hsqs'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# paths relative to the image root
+MAKE_PROFILE = 'etc/portage/make.profile'
+SETS_DIR = 'etc/portage/sets'
+WORLD = 'var/lib/portage/world'
+WORLD_SETS = 'var/lib/portage/world_sets'
+VDB = 'var/db/pkg'
+# vdb entry files needed to match atoms and for extended data
+# (EAPI is needed to normalize SLOT)
+VDB_KEYS = ('EAPI', 'SLOT', 'USE', 'repository')
+
+PROFILE_REPO_RE = re.compile(r'^([\w][\w+-]*):(.*)$')
+
+
+class ImageFormatError(Exception):
+    """Image format is not supported"""
+
+    pass
+
+
+def is_wanted(path: str) -> bool:
+    """
+    Check whether file is needed to generate the report
+
+    Return True if `path` (relative to the image root) refers to one
+    of the files read to determine profile and @world.
+    """
+
+    if path in (MAKE_PROFILE, MAKE_PROFILE + '/parent',
+                WORLD, WORLD_SETS):
+        return True
+    head, name = posixpath.split(path)
+    if head == SETS_DIR:
+        return True
+    return (name in VDB_KEYS
+            and posixpath.dirname(posixpath.dirname(head)) == VDB)
+
+
+def normalize_member_path(path: str) -> str:
+    """Strip leading './' and '/' from archive member path"""
+
+    return posixpath.normpath('/' + path).lstrip('/')
+
+
+class ImageContents(object):
+    """Files extracted from a system image"""
+
+    def __init__(self) -> None:
+        self.files: typing.Dict[str, bytes] = {}
+        self.symlinks: typing.Dict[str, str] = {}
+
+    def read_tarball(self, f: typing.BinaryIO) -> None:
+        """
+        Extract wanted files from a tarball
+
+        Stream through the (possibly compressed) tar archive read
+        from `f` once, and store wanted files in memory.
+        """
+
+        with tarfile.open(fileobj=f, mode='r|*') as tar:
+            for member in tar:
+                path = normalize_member_path(member.name)
+                if not is_wanted(path):
+                    continue
+                if member.issym():
+                    self.symlinks[path] = member.linkname
+                elif member.isfile():
+                    data = tar.extractfile(member)
+                    assert data is not None
+                    self.files[path] = data.read()
+                elif member.islnk():
+                    # hardlinks can only be resolved to earlier members
+                    target = normalize_member_path(member.linkname)
+                    if target in self.files:
+                        self.files[path] = self.files[target]
+
+    def read_squashfs(self, path: Path) -> None:
+        """
+        Extract wanted files from a squashfs image
+
+        Look up wanted files in the directory tree of the squashfs image
+        at `path`, and read only their contents.  Requires
+        PySquashfsImage.
+        """
+
+        try:
+            from PySquashfsImage import SquashFsImage
+        except ImportError:
+            raise ImageFormatError(
+                'PySquashfsImage is required to read squashfs images')
+
+        def add(f: typing.Any, path: str) -> None:
+            if f is None:
+                return
+            if f.is_symlink:
+                self.symlinks[path] = f.readlink()
+            elif f.is_file:
+                self.files[path] = f.read_bytes()
+
+        with SquashFsImage.from_file(str(path)) as image:
+            for p in (MAKE_PROFILE, MAKE_PROFILE + '/parent',
+                      WORLD, WORLD_SETS):
+                add(image.select('/' + p), p)
+            sets = image.select('/' + SETS_DIR)
+            if sets is not None and sets.is_dir:
+                for f in sets:
+                    add(f, f'{SETS_DIR}/{f.name}')
+            vdb = image.select('/' + VDB)
+            if vdb is not None and vdb.is_dir:
+                for cat in vdb:
+                    if not cat.is_dir:
+                        continue
+                    for pkg in cat:
+                        if not pkg.is_dir:
+                            continue
+                        for k in VDB_KEYS:
+                            add(pkg.children.get(k),
+                                f'{VDB}/{cat.name}/{pkg.name}/{k}')
+
+
+def read_image(path: Path) -> ImageContents:
+    """
+    Extract files needed for the report from image at `path`
+
+    Supported formats are tarballs (uncompressed, or compressed using
+    gzip, bzip2, xz or zstd) and squashfs images.  zstd requires
+    the zstandard module.
+    """
+
+    contents = ImageContents()
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+        f.seek(0)
+        if magic == SQUASHFS_MAGIC:
+            contents.read_squashfs(path)
+        elif magic == ZSTD_MAGIC:
+            try:
+                import zstandard
+            except ImportError:
+                raise ImageFormatError(
+                    'zstandard is required to read .zst tarballs')
+            with (zstandard.ZstdDecompressor()
+                  .stream_reader(f)) as zf:
+                contents.read_tarball(typing.cast(typing.BinaryIO, zf))
+        else:
+            try:
+                contents.read_tarball(f)
+            except tarfile.ReadError as e:
+                raise ImageFormatError(
+                    f'Unsupported image format: {e}')
+    return contents
+
+
+def gentoo_profile_from_path(path: str) -> typing.Optional[str]:
+    """
+    Get Gentoo profile name from an absolute profile path
+
+    Return the path relative to the profiles directory if `path` points
+    to a profile in the Gentoo repository, None otherwise.  Since
+    the repository configuration is not read, the repository is
+    recognized by its default locations.
+    """
+
+    parts = PurePosixPath(posixpath.normpath(path)).parts
+    if 'profiles' not in parts:
+        return None
+    i = parts.index('profiles')
+    repo = parts[:i]
+    if repo[-1:] != ('gentoo',) and repo != ('/', 'usr', 'portage'):
+        return None
+    if len(parts) == i + 1:
+        return None
+    return '/'.join(parts[i+1:])
+
+
+def read_lines(data: bytes) -> typing.List[str]:
+    """Split file into lines, skipping empty lines and comments"""
+
+    ret = []
+    for line in data.decode('utf-8', errors='replace').splitlines():
+        line = line.strip()
+        if line and not line.startswith('#'):
+            ret.append(line)
+    return ret
+
+
+class ImageAPI(object):
+    """System image wrapper"""
+
+    def __init__(self,
+                 path: Path
+                 ) -> None:
+        """
+        Instantiate a new instance and read the image
+
+        Read the files needed for the report from image at `path`,
+        without unpacking it to disk.
+        """
+
+        self.contents = read_image(path)
+
+    @property
+    def profile(self) -> typing.Optional[str]:
+        """
+        Profile selected in the image
+
+        Get the profile selected via make.profile symlink, or the last
+        parent of make.profile directory.  Return None if the profile
+        can't be established or if it is a non-Gentoo profile.
+        """
+
+        etcprof = '/' + MAKE_PROFILE
+        target = self.contents.symlinks.get(MAKE_PROFILE)
+        if target is not None:
+            return gentoo_profile_from_path(
+                posixpath.join(posixpath.dirname(etcprof), target))
+
+        parent = self.contents.files.get(MAKE_PROFILE + '/parent')
+        if parent is None:
+            return None
+        lines = read_lines(parent)
+        if not lines:
+            return None
+        m = PROFILE_REPO_RE.match(lines[-1])
+        if m is not None:
+            if m.group(1) != 'gentoo':
+                return None
+            return m.group(2).strip('/') or None
+        return gentoo_profile_from_path(
+            posixpath.join(etcprof, lines[-1]))
+
+    def set_atoms(self,
+                  name: str,
+                  seen: typing.Set[str]
+                  ) -> typing.Iterator[str]:
+        """
+        Atoms of user-defined package set
+
+        Yield atoms from /etc/portage/sets/`name`, recursively expanding
+        nested sets.  Sets that are not defined there are skipped.
+        """
+
+        if name in seen:
+            return
+        seen.add(name)
+        data = self.contents.files.get(f'{SETS_DIR}/{name}')
+        if data is None:
+            return
+        for x in read_lines(data):
+            if x.startswith('@'):
+                yield from self.set_atoms(x[1:], seen)
+            else:
+                yield x
+
+    @property
+    def world_atoms(self) -> typing.List[Atom]:
+        """Atoms in the @world set (world and world_sets files)"""
+
+        atoms = read_lines(self.contents.files.get(WORLD, b''))
+        seen: typing.Set[str] = set()
+        for x in read_lines(self.contents.files.get(WORLD_SETS, b'')):
+            if x.startswith('@'):
+                atoms.extend(self.set_atoms(x[1:], seen))
+
+        ret = []
+        for x in atoms:
+            try:
+                ret.append(Atom(x, allow_repo=True))
+            except InvalidAtom:
+                continue
+        return ret
+
+    @property
+    def installed(self) -> typing.Dict[_pkg_str, typing.Dict[str, str]]:
+        """Packages installed in the image, along with their metadata"""
+
+        entries: typing.Dict[str, typing.Dict[str, str]] = {}
+        for path, data in self.contents.files.items():
+            if not path.startswith(VDB + '/'):
+                continue
+            cpv, key = posixpath.split(path[len(VDB)+1:])
+            entries.setdefault(cpv, {})[key] = (
+                data.decode('utf-8', errors='replace').strip())
+
+        ret = {}
+        for cpv, metadata in entries.items():
+            metadata['SLOT'] = normalize_slot(metadata.get('SLOT'),
+                                              metadata.pop('EAPI', None))
+            try:
+                pkg = _pkg_str(
+                    cpv,
+                    slot=metadata['SLOT'],
+                    repo=metadata.get('repository') or _unknown_repo)
+                ret[pkg] = metadata
+            except InvalidData:
+                # e.g. -MERGING- entries
+                continue
+        return ret
+
+    def get_world(self,
+                  fields: typing.Collection[str] = ()
+                  ) -> typing.Tuple[typing.List[str], WorldDetails]:
+        """
+        Packages currently enabled via @world set, with extended data
+
+        Get the list of packages as returned by world, along with
+        extended `fields` for the matched installed packages.
+        """
+
+        installed = self.installed
+        matches = match_world(self.world_atoms, installed)
+        return (sorted(set(m.cp for m in matches)),
+                world_details(((m, installed[m]) for m in matches),
+                              fields))
+
+    @property
+    def world(self) -> typing.List[str]:
+        """
+        Packages currently enabled via @world set
+
+        Get the list of packages listed in the @world set, matched
+        against packages installed in the image.  The result is
+        filtered the same way as PortageAPI.world does.
+        """
+
+        return self.get_world()[0]
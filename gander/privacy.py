@@ -3,6 +3,10 @@
 
 """Gander privacy policy"""
 
+import hashlib
+import typing
+
+
 # this is in .py, so we can reliably import it without jumping through
 # hoops
 
@@ -62,3 +66,12 @@ Its code as well as this policy is still subject to changes.
    discarded.  A configured Gander instance submits new reports every
    7 days.
 """.strip()
+
+PRIVACY_POLICY_VERSION = 1
+PRIVACY_POLICY_HASH = hashlib.sha256(PRIVACY_POLICY.encode()).hexdigest()
+
+# optional package data fields (see gander.report.EXTENDED_FIELDS)
+# permitted by the specific Privacy Policy version
+POLICY_EXTENDED_FIELDS: typing.Dict[int, typing.FrozenSet[str]] = {
+    1: frozenset(),
+}
@@ -0,0 +1,180 @@
+# (c) 2020 Michał Górny
+# 2-clause BSD license
+
+"""Built-in profiler for diagnosing slow report generation"""
+
+import collections
+import cProfile
+import os.path
+import pstats
+import signal
+import types
+import typing
+
+from pathlib import Path
+
+from gander.report import PortageAPI
+
+
+# CPU time between stack samples, in seconds
+SAMPLE_INTERVAL = 0.001
+
+TAG_API = 'api'
+TAG_GANDER = 'gander'
+TAG_PORTAGE = 'portage'
+TAG_OTHER = 'other'
+
+# top-level modules of Portage
+PORTAGE_MODULES = frozenset(['portage', '_emerge'])
+
+
+def get_api_codes() -> typing.Set[types.CodeType]:
+    """Get code objects of PortageAPI methods and properties"""
+
+    ret = set()
+    for v in vars(PortageAPI).values():
+        if isinstance(v, property):
+            v = v.fget
+        code = getattr(v, '__code__', None)
+        if code is not None:
+            ret.add(code)
+    return ret
+
+
+def module_tag(module: str) -> str:
+    """Get frame tag for functions in `module`"""
+
+    top = module.split('.', 1)[0]
+    if top == 'gander':
+        return TAG_GANDER
+    if top in PORTAGE_MODULES:
+        return TAG_PORTAGE
+    return TAG_OTHER
+
+
+class StackSampler(object):
+    """SIGPROF-based sampling profiler collecting folded stacks"""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL) -> None:
+        self.interval = interval
+        self.api_codes = get_api_codes()
+        self.stacks: typing.Counter[typing.Tuple[str, ...]] = (
+            collections.Counter())
+        self.leaf_tags: typing.Counter[str] = collections.Counter()
+        self.labels: typing.Dict[types.CodeType,
+                                 typing.Tuple[str, str]] = {}
+
+    def label(self, frame: types.FrameType) -> typing.Tuple[str, str]:
+        """Get (tag, label) for the function executing in `frame`"""
+
+        code = frame.f_code
+        ret = self.labels.get(code)
+        if ret is None:
+            module = frame.f_globals.get('__name__', '?')
+            name = getattr(code, 'co_qualname', code.co_name)
+            if code in self.api_codes:
+                tag = TAG_API
+                name = f'PortageAPI.{code.co_name}'
+            else:
+                tag = module_tag(module)
+            ret = self.labels[code] = (tag, f'{tag}:{module}.{name}')
+        return ret
+
+    def sample(self,
+               signum: int,
+               frame: typing.Optional[types.FrameType]
+               ) -> None:
+        stack = []
+        leaf_tag = None
+        while frame is not None:
+            tag, label = self.label(frame)
+            if leaf_tag is None:
+                leaf_tag = tag
+            stack.append(label)
+            frame = frame.f_back
+        if leaf_tag is not None:
+            self.stacks[tuple(reversed(stack))] += 1
+            self.leaf_tags[leaf_tag] += 1
+
+    def start(self) -> None:
+        self.old_handler = signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self) -> None:
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self.old_handler)
+
+    def write_folded(self, path: Path) -> None:
+        """Write stacks to `path` in flamegraph.pl folded format"""
+
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f'{";".join(stack)} {count}\n')
+
+
+class Profiler(object):
+    """cProfile and stack sampler combined"""
+
+    def __init__(self) -> None:
+        self.profile = cProfile.Profile()
+        self.sampler = StackSampler()
+
+    def __enter__(self) -> 'Profiler':
+        self.sampler.start()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *args: typing.Any) -> None:
+        self.profile.disable()
+        self.sampler.stop()
+
+    def write(self, path: Path) -> typing.List[Path]:
+        """
+        Write profiling results
+
+        Write cProfile data to `path` with .pstats suffix appended,
+        and folded stacks to `path` with .folded suffix appended.
+        Return the list of paths written.
+        """
+
+        pstats_path = Path(f'{path}.pstats')
+        folded_path = Path(f'{path}.folded')
+        self.profile.dump_stats(pstats_path)
+        self.sampler.write_folded(folded_path)
+        return [pstats_path, folded_path]
+
+    def tag_times(self) -> typing.Dict[str, float]:
+        """Get cProfile self time of functions per tag"""
+
+        api_keys = set((c.co_filename, c.co_firstlineno, c.co_name)
+                       for c in self.sampler.api_codes)
+        gander_dir = os.path.dirname(__file__)
+        ret: typing.Dict[str, float] = collections.defaultdict(float)
+        stats = pstats.Stats(self.profile).stats  # type: ignore
+        for key, (cc, nc, tt, ct, callers) in stats.items():
+            filename = key[0]
+            if key in api_keys:
+                tag = TAG_API
+            elif filename.startswith(gander_dir + os.sep):
+                tag = TAG_GANDER
+            elif any(f'{os.sep}{m}{os.sep}' in filename
+                     for m in PORTAGE_MODULES):
+                tag = TAG_PORTAGE
+            else:
+                tag = TAG_OTHER
+            ret[tag] += tt
+        return dict(ret)
+
+    def summary(self) -> str:
+        """Get human-readable summary of time spent per tag"""
+
+        times = self.tag_times()
+        total_time = sum(times.values()) or 1.0
+        total_samples = sum(self.sampler.leaf_tags.values()) or 1
+        parts = []
+        for tag in (TAG_API, TAG_GANDER, TAG_PORTAGE, TAG_OTHER):
+            t = times.get(tag, 0.0)
+            samples = self.sampler.leaf_tags[tag]
+            parts.append(f'{tag} {t:.2f} s ({t / total_time:.0%}), '
+                         f'{samples / total_samples:.0%} samples')
+        return '; '.join(parts)
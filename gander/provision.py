@@ -0,0 +1,160 @@
+# (c) 2020 Michał Górny
+# 2-clause BSD license
+
+"""Machine identifier and Privacy Policy acceptance provisioning"""
+
+import os
+import re
+import secrets
+import tempfile
+import typing
+
+from pathlib import Path
+
+from gander.privacy import PRIVACY_POLICY_HASH, PRIVACY_POLICY_VERSION
+
+
+MACHINE_ID_RE = re.compile(r'[0-9a-f]{32}')
+SYSTEM_MACHINE_ID_PATH = Path('/etc/gander.id')
+
+
+class ProvisionResult(typing.NamedTuple):
+    root: Path
+    machine_id: typing.Optional[str]
+    status: str
+
+
+def generate_machine_id() -> str:
+    # NB: we don't really need cryptographic security but the 'secrets'
+    # module is convenient to use
+    return secrets.token_hex(16)
+
+
+def read_machine_id(path: Path) -> typing.Optional[str]:
+    """Read machine id from `path`, return None if missing or invalid"""
+
+    try:
+        with open(path, 'r') as f:
+            machine_id = f.read().strip()
+    except FileNotFoundError:
+        return None
+    if not MACHINE_ID_RE.match(machine_id):
+        return None
+    return machine_id
+
+
+def write_atomic(path: Path,
+                 data: str,
+                 overwrite: bool = True
+                 ) -> None:
+    """
+    Write `data` to `path` atomically
+
+    Write the data into a temporary file in the same directory, and then
+    rename it over `path`.  If `overwrite` is False, hardlink it instead
+    so that FileExistsError is raised if `path` has been created
+    in the meantime.
+    """
+
+    os.makedirs(path.parent, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, 0o644)
+        if overwrite:
+            os.replace(tmp, path)
+        else:
+            os.link(tmp, path)
+    finally:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+
+
+def get_policy_path(machine_id_path: Path) -> Path:
+    """Get path to Privacy Policy acceptance record for machine id"""
+
+    return machine_id_path.with_suffix('.policy')
+
+
+def record_policy_acceptance(machine_id_path: Path) -> None:
+    """Record acceptance of the current Privacy Policy"""
+
+    write_atomic(get_policy_path(machine_id_path),
+                 f'{PRIVACY_POLICY_VERSION} {PRIVACY_POLICY_HASH}\n')
+
+
+def read_accepted_policy(machine_id_path: Path) -> typing.Optional[int]:
+    """
+    Get accepted Privacy Policy version
+
+    Return the version recorded alongside `machine_id_path`, or None
+    if no acceptance has been recorded.
+    """
+
+    try:
+        with open(get_policy_path(machine_id_path), 'r') as f:
+            return int(f.read().split()[0])
+    except (FileNotFoundError, IndexError, ValueError):
+        return None
+
+
+def provision_roots(roots: typing.Iterable[Path]
+                    ) -> typing.Iterator[ProvisionResult]:
+    """
+    Provision machine ids for multiple system roots
+
+    Ensure that every root in `roots` has a valid machine id, and record
+    Privacy Policy acceptance for it.  Roots that are not existing
+    directories (e.g. mistyped or unmounted) fail rather than being
+    created.  Existing ids are kept, unless
+    they duplicate the id of an earlier root (e.g. in cloned
+    containers).  New ids are checked for collisions against all ids
+    seen so far.  Yield the result for every root.
+    """
+
+    seen: typing.Dict[str, Path] = {}
+    done: typing.Set[Path] = set()
+
+    for root in roots:
+        if root in done:
+            yield ProvisionResult(root, None, 'skipped (duplicate root)')
+            continue
+        done.add(root)
+
+        if not root.is_dir():
+            yield ProvisionResult(root, None,
+                                  'failed: root is not an existing '
+                                  'directory')
+            continue
+
+        id_path = root / SYSTEM_MACHINE_ID_PATH.relative_to('/')
+        try:
+            # create etc/ only inside the existing root
+            id_path.parent.mkdir(exist_ok=True)
+            machine_id = read_machine_id(id_path)
+            if machine_id is None:
+                status = 'created'
+            elif machine_id in seen:
+                status = f'regenerated (duplicate of {seen[machine_id]})'
+                machine_id = None
+            else:
+                status = 'kept'
+
+            if machine_id is None:
+                machine_id = generate_machine_id()
+                while machine_id in seen:
+                    machine_id = generate_machine_id()
+                write_atomic(id_path, f'{machine_id}\n',
+                             overwrite=id_path.exists())
+            record_policy_acceptance(id_path)
+        except OSError as e:
+            yield ProvisionResult(root, None, f'failed: {e}')
+            continue
+
+        seen[machine_id] = root
+        yield ProvisionResult(root, machine_id, status)
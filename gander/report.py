@@ -5,10 +5,131 @@
 
 from pathlib import Path
 
+import functools
 import typing
 
-from portage import create_trees
+from portage import (binarytree, config, create_trees, portagetree,
+                     vartree)
 from portage._sets import load_default_config
+from portage.const import VDB_PATH
+from portage.dep import Atom, match_from_list
+from portage.repository.config import RepoConfigLoader
+from portage.util import LazyItemsDict
+from portage.versions import _pkg_str, _unknown_repo, best, vercmp
+
+from gander.background import Pacer
+from gander.vdbindex import read_installed
+from gander.vdbscan import scan_vdb
+
+
+def is_gentoo_repo(repo: typing.Optional[str]) -> bool:
+    """
+    Check whether package comes from ::gentoo
+
+    Return True if `repo` is 'gentoo' or unset.  Packages whose
+    repository is unknown are assumed to come from ::gentoo.
+    """
+
+    return not repo or repo == 'gentoo'
+
+
+# optional per-package fields, and vdb metadata keys needed for them
+EXTENDED_FIELDS: typing.Dict[str, typing.Tuple[str, ...]] = {
+    'version': (),
+    'slot': ('SLOT',),
+    'use': ('USE',),
+}
+
+PackageDetails = typing.Dict[str, typing.Union[str, typing.List[str]]]
+WorldDetails = typing.Dict[str, typing.List[PackageDetails]]
+
+
+def extended_keys(fields: typing.Iterable[str]) -> typing.List[str]:
+    """Get the list of metadata keys needed for extended `fields`"""
+
+    ret: typing.List[str] = []
+    for f in fields:
+        for k in EXTENDED_FIELDS[f]:
+            if k not in ret:
+                ret.append(k)
+    return ret
+
+
+def package_details(pkg: _pkg_str,
+                    metadata: typing.Mapping[str, str],
+                    fields: typing.Iterable[str]
+                    ) -> PackageDetails:
+    """
+    Get extended data for a single package
+
+    Build a dict of extended `fields` for package `pkg`, using
+    `metadata` that contains the keys returned by extended_keys().
+    """
+
+    ret: PackageDetails = {}
+    for f in fields:
+        if f == 'version':
+            ret[f] = pkg.version
+        elif f == 'slot':
+            ret[f] = metadata.get('SLOT', '')
+        elif f == 'use':
+            ret[f] = sorted(metadata.get('USE', '').split())
+    return ret
+
+
+def world_details(packages: typing.Iterable[typing.Tuple[
+                      _pkg_str, typing.Mapping[str, str]]],
+                  fields: typing.Collection[str]
+                  ) -> WorldDetails:
+    """
+    Group extended package data by package name
+
+    Return a dict mapping package names to lists of extended data
+    for every package in `packages`, sorted by version.  Duplicate
+    packages are skipped.
+    """
+
+    ret: WorldDetails = {}
+    seen = set()
+    vercmp_key = functools.cmp_to_key(vercmp)
+    for pkg, metadata in sorted(packages,
+                                key=lambda x: (x[0].cp,
+                                               vercmp_key(x[0].version))):
+        if pkg in seen:
+            continue
+        seen.add(pkg)
+        ret.setdefault(pkg.cp, []).append(
+            package_details(pkg, metadata, fields))
+    return ret
+
+
+def match_world(atoms: typing.Iterable[Atom],
+                installed: typing.Iterable[_pkg_str]
+                ) -> typing.List[_pkg_str]:
+    """
+    Match @world atoms against a list of installed packages
+
+    Find the best installed match for every atom in `atoms`, and return
+    the list of matches, filtered to packages coming from ::gentoo.
+    This mirrors PortageAPI.world for package lists that were obtained
+    without the vdb API.
+    """
+
+    by_cp: typing.Dict[str, typing.List[_pkg_str]] = {}
+    for p in installed:
+        by_cp.setdefault(p.cp, []).append(p)
+
+    ret = []
+    for x in atoms:
+        m = best(match_from_list(x, by_cp.get(x.cp, [])))
+        if not m:
+            # skip uninstalled packages
+            continue
+        if m.repo != _unknown_repo and not is_gentoo_repo(m.repo):
+            # skip packages from other repositories
+            continue
+        ret.append(m)
+    return ret
 
 
 class GentooRepoNotFound(Exception):
@@ -21,20 +142,54 @@ class PortageAPI(object):
     """Portage API wrapper"""
 
     def __init__(self,
-                 config_root: typing.Optional[Path] = None
+                 config_root: typing.Optional[Path] = None,
+                 repositories: typing.Optional[RepoConfigLoader] = None,
+                 pacer: typing.Optional[Pacer] = None,
+                 scan_jobs: typing.Optional[int] = None
                  ) -> None:
         """
         Instantiate a new instance and load Portage configs
 
         Load Portage config from optional `config_root`.  If it is not
         specified, the current Portage configuration is loaded.
+
+        If `repositories` are specified, the repository configuration
+        is reused rather than loaded again, and only the trees for
+        the target root are created.
+
+        If `pacer` is specified, it is called after every atom resolved
+        (or package read, with `scan_jobs`) in order to throttle
+        the vdb reads.
+
+        If `scan_jobs` is specified, the vdb is read directly using
+        the specified number of parallel threads rather than via
+        the Portage API (see get_scanned_world()).
         """
 
-        kwargs = {}
-        if config_root is not None:
-            kwargs['config_root'] = config_root
-        trees = create_trees(**kwargs)
-        self.tree = trees[max(trees)]
+        self.pacer = pacer
+        self.scan_jobs = scan_jobs
+
+        if repositories is None:
+            kwargs = {}
+            if config_root is not None:
+                kwargs['config_root'] = config_root
+            trees = create_trees(**kwargs)
+            self.tree = trees[max(trees)]
+        else:
+            settings = config(config_root=config_root,
+                              repositories=repositories)
+            settings.lock()
+            # mirror create_trees() for the target root
+            self.tree = LazyItemsDict()
+            self.tree.addLazySingleton('virtuals', settings.getvirtuals)
+            self.tree.addLazySingleton('vartree', vartree,
+                                       categories=settings.categories,
+                                       settings=settings)
+            self.tree.addLazySingleton('porttree', portagetree,
+                                       settings=settings)
+            self.tree.addLazySingleton('bintree', binarytree,
+                                       pkgdir=settings['PKGDIR'],
+                                       settings=settings)
         self.dbapi = self.tree['porttree'].dbapi
         self.vdb = self.tree['vartree']
 
@@ -46,6 +201,12 @@ class PortageAPI(object):
             raise GentooRepoNotFound(
                 'Unable to find ::gentoo repository')
 
+    @property
+    def repositories(self) -> RepoConfigLoader:
+        """Repository configuration, to be reused by other instances"""
+
+        return self.dbapi.settings.repositories
+
     @property
     def profile(self) -> typing.Optional[str]:
         """
@@ -71,6 +232,123 @@ class PortageAPI(object):
                 break
         return None
 
+    @property
+    def eroot(self) -> Path:
+        """Effective root directory of the installed system"""
+
+        return Path(self.vdb.settings['EROOT'])
+
+    @property
+    def world_atoms(self) -> typing.List[Atom]:
+        """Atoms in the @world set"""
+
+        setconf = load_default_config(self.dbapi.settings, self.tree)
+        return list(setconf.getSetAtoms('world'))
+
+    def match_installed(self,
+                        atom: Atom,
+                        keys: typing.Sequence[str] = ('repository',)
+                        ) -> typing.Optional[typing.Tuple[
+                            _pkg_str, typing.Dict[str, str]]]:
+        """
+        Find the best installed match for an atom
+
+        Return a tuple of the best installed package matching `atom`
+        and a dict of its metadata `keys`, that must include
+        'repository'.  Return None if no package is installed, or if
+        the best match does not come from ::gentoo.
+        """
+
+        m = self.vdb.dep_bestmatch(atom)
+        if not m:
+            return None
+        metadata = dict(zip(keys, self.vdb.dbapi.aux_get(m, list(keys))))
+        if not is_gentoo_repo(metadata['repository']):
+            return None
+        return m, metadata
+
+    def get_world(self,
+                  fields: typing.Collection[str] = ()
+                  ) -> typing.Tuple[typing.List[str], WorldDetails]:
+        """
+        Packages currently enabled via @world set, with extended data
+
+        Get the list of packages listed in the @world set, along with
+        extended data for the matched installed packages.  Extended
+        `fields` are collected in the same pass over the vdb, with all
+        metadata fetched in a single aux_get() call per package.
+        If no `fields` are requested, the vdb index is used when
+        available (see get_indexed_world()).
+        """
+
+        if not fields:
+            world = self.get_indexed_world()
+            if world is not None:
+                return world, {}
+        if self.scan_jobs is not None:
+            return self.get_scanned_world(self.scan_jobs, fields)
+
+        keys = ['repository'] + extended_keys(fields)
+        ret = set()
+        matches = []
+        atoms = self.world_atoms
+        if self.pacer is not None:
+            # do not account loading the configuration to the first atom
+            self.pacer.start()
+        for x in atoms:
+            match = self.match_installed(x, keys)
+            if self.pacer is not None:
+                self.pacer()
+            if match is None:
+                continue
+            ret.add(x.cp)
+            if fields:
+                matches.append(match)
+        return sorted(ret), world_details(matches, fields)
+
+    def get_indexed_world(self) -> typing.Optional[typing.List[str]]:
+        """
+        Packages currently enabled via @world set, using vdb index
+
+        Resolve the @world set against the vdb index maintained
+        by the Portage hook.  Return None if the index is missing
+        or inconsistent with the vdb.
+        """
+
+        installed = read_installed(self.eroot)
+        if installed is None:
+            return None
+        matches = match_world(self.world_atoms, installed)
+        return sorted(set(m.cp for m in matches))
+
+    def get_scanned_world(self,
+                          jobs: int,
+                          fields: typing.Collection[str] = ()
+                          ) -> typing.Tuple[typing.List[str], WorldDetails]:
+        """
+        Packages currently enabled via @world set, using parallel scan
+
+        Get the same result as get_world(), reading the vdb directly
+        with up to `jobs` parallel threads.  This is faster for roots
+        on network filesystems, where every vdb access is a round-trip.
+        If a pacer is used, packages are read one at a time.
+        """
+
+        atoms = self.world_atoms
+        if self.pacer is not None:
+            self.pacer.start()
+        installed = scan_vdb(self.eroot / VDB_PATH,
+                             set(x.cp for x in atoms),
+                             ['SLOT', 'repository'] + extended_keys(fields),
+                             jobs,
+                             pacer=self.pacer)
+        matches = match_world(atoms, installed)
+        details: WorldDetails = {}
+        if fields:
+            details = world_details(((m, installed[m]) for m in matches),
+                                    fields)
+        return sorted(set(m.cp for m in matches)), details
+
     @property
     def world(self) -> typing.List[str]:
         """
@@ -81,16 +359,4 @@ class PortageAPI(object):
         Return an empty list if there is no @world set.
         """
 
-        setconf = load_default_config(self.dbapi.settings, self.tree)
-        ret = set()
-        for x in setconf.getSetAtoms('world'):
-            m = self.vdb.dep_bestmatch(x)
-            if not m:
-                # skip uninstalled packages
-                continue
-            repo, = self.vdb.dbapi.aux_get(m, ['repository'])
-            if repo and repo != 'gentoo':
-                # skip packages from other repositories
-                continue
-            ret.add(x.cp)
-        return sorted(ret)
+        return self.get_world()[0]
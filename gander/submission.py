@@ -0,0 +1,153 @@
+# (c) 2020 Michał Górny
+# 2-clause BSD license
+
+"""Report submission"""
+
+import collections
+import concurrent.futures
+import json
+import secrets
+import threading
+import typing
+import urllib.parse
+
+import requests
+import requests.adapters
+
+from gander.provision import MACHINE_ID_RE
+
+
+USER_AGENT = 'gander'
+
+
+class SubmissionResult(typing.NamedTuple):
+    lineno: int
+    machine_id: typing.Optional[str]
+    status_code: typing.Optional[int]
+    message: str
+
+    @property
+    def accepted(self) -> bool:
+        return self.status_code is not None and self.status_code < 400
+
+
+def get_proxies(scheme: str, tor: bool) -> typing.Dict[str, str]:
+    """Get requests proxy configuration, optionally routing via tor"""
+
+    if not tor:
+        return {}
+    route = secrets.token_hex(2)
+    return {
+        # TODO: guess and use 127.0.0.1 / ::1 instead?
+        scheme: f'socks5h://gander{route}@localhost:9050',
+    }
+
+
+def get_failure_hint(status_code: int,
+                     data: typing.Dict[str, typing.Any]
+                     ) -> typing.Optional[str]:
+    """
+    Explain a failed submission
+
+    Get the user-facing explanation for submission of report `data`
+    being rejected with `status_code`, or None if the status code does
+    not have a known meaning.
+    """
+
+    if status_code >= 500 and status_code < 600:
+        return ('The server seems to be having trouble, please try again '
+                'later.')
+    elif status_code == 429:
+        return 'Please wait 7 days between successive submissions.'
+    elif status_code == 413:
+        rep_mib = len(json.dumps(data)) / 1024 / 1024
+        return (f'The report ({rep_mib:.2f} MiB) seems to have exceeded '
+                f'server-defined request size limit.\n'
+                f'Please file a bug at https://bugs.gentoo.org/, asking '
+                f'Gentoo Infra to increase the limit.')
+    elif status_code == 404:
+        return 'Did you specify a correct API endpoint URL?'
+    return None
+
+
+def submit_line(session: requests.Session,
+                url: str,
+                lineno: int,
+                line: str,
+                proxies: typing.Dict[str, str],
+                timeout: float
+                ) -> SubmissionResult:
+    """Submit report serialized as JSON `line`"""
+
+    try:
+        data = json.loads(line)
+        machine_id = data['id']
+        if not MACHINE_ID_RE.match(machine_id):
+            raise ValueError(f'invalid machine id: {machine_id}')
+    except (ValueError, TypeError, KeyError) as e:
+        return SubmissionResult(lineno, None, None, f'invalid report: {e}')
+
+    try:
+        resp = session.put(url, json=data, proxies=proxies,
+                           timeout=timeout)
+    except requests.RequestException as e:
+        return SubmissionResult(lineno, machine_id, None,
+                                f'submission failed: {e}')
+    if resp:
+        return SubmissionResult(lineno, machine_id, resp.status_code,
+                                'accepted')
+    hint = get_failure_hint(resp.status_code, data)
+    if hint is None:
+        hint = resp.text.strip()
+    return SubmissionResult(lineno, machine_id, resp.status_code,
+                            'rejected: ' + ' '.join(hint.split()))
+
+
+def submit_reports(url: str,
+                   lines: typing.Iterable[str],
+                   jobs: int,
+                   tor: bool = False,
+                   timeout: float = 30
+                   ) -> typing.Iterator[SubmissionResult]:
+    """
+    Submit multiple reports concurrently
+
+    Submit reports serialized as JSON `lines` to `url`, using up to
+    `jobs` concurrent requests sharing a single connection pool.
+    If `tor` is True, every worker thread routes its reports via
+    a separate tor circuit, so that the number of open proxy
+    connections is bounded by `jobs`.  Empty lines are skipped.  Yield
+    the results in input order.
+    """
+
+    scheme = urllib.parse.urlparse(url).scheme
+    local = threading.local()
+
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                            pool_maxsize=jobs)
+    with requests.Session() as session:
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['User-Agent'] = USER_AGENT
+
+        def submit(lineno: int, line: str) -> SubmissionResult:
+            # NB: proxies need to be passed to every request,
+            # as session.proxies are overridden by the environment
+            if not hasattr(local, 'proxies'):
+                local.proxies = get_proxies(scheme, tor)
+            return submit_line(session, url, lineno, line, local.proxies,
+                               timeout)
+
+        with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+            # limit the number of reports read ahead
+            pending: typing.Deque[
+                concurrent.futures.Future[SubmissionResult]] = (
+                    collections.deque())
+            for lineno, line in enumerate(lines, start=1):
+                if not line.strip():
+                    continue
+                pending.append(executor.submit(submit, lineno, line))
+                if len(pending) >= 2 * jobs:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
@@ -0,0 +1,320 @@
+# (c) 2020 Michał Górny
+# 2-clause BSD license
+
+"""Installed package index maintained from Portage hooks"""
+
+import fcntl
+import os
+import re
+import typing
+
+from pathlib import Path
+
+from portage.const import CACHE_PATH, VDB_PATH
+from portage.exception import InvalidData
+from portage.versions import _pkg_str, _unknown_repo
+
+from gander.provision import write_atomic
+from gander.vdbscan import (list_category,
+                            normalize_slot,
+                            read_file,
+                            )
+
+
+INDEX_PATH = 'var/cache/gander/vdb-index'
+INDEX_HEADER = '# gander vdb index v2'
+COUNTER_PATH = f'{CACHE_PATH}/counter'
+# placeholder for empty values, neither slots nor repository names
+# can start with a hyphen
+EMPTY = '-'
+
+HOOK_BEGIN = '# BEGIN gander vdb index hook'
+HOOK_END = '# END gander vdb index hook'
+BASHRC_HOOK = f'''{HOOK_BEGIN}
+gander_vdb_index_update() {{
+\tcommand -v gander >/dev/null || return 0
+\tgander --update-vdb-index --cpv "${{CATEGORY}}/${{PF}}" \\
+\t\t--eroot "${{EROOT:-${{ROOT:-/}}}}" "${{@}}" \\
+\t\t|| ewarn "gander: unable to update the vdb index"
+}}
+
+post_pkg_postinst() {{
+\tgander_vdb_index_update
+}}
+
+post_pkg_postrm() {{
+\t# reinstalling the same version, postinst updates the entry
+\t[[ ${{REPLACED_BY_VERSION}} == "${{PVR}}" ]] && return 0
+\tgander_vdb_index_update --removed
+}}
+{HOOK_END}
+'''
+HOOK_FUNCTION_RE = re.compile(
+    r'^\s*(function\s+)?post_pkg_post(inst|rm)\b', re.MULTILINE)
+
+# (slot, repository) for every cpv
+IndexEntries = typing.Dict[str, typing.Tuple[str, str]]
+
+
+class HookConflict(Exception):
+    """bashrc defines the hook functions already"""
+
+    pass
+
+
+class VdbIndex(typing.NamedTuple):
+    counter: int
+    packages: IndexEntries
+    # vdb mtime (in ns) when the index was last verified against it
+    verified_mtime: int = 0
+
+
+def read_counter(path: Path) -> typing.Optional[int]:
+    """Read a COUNTER value from `path`, return None if unavailable"""
+
+    try:
+        with open(path, 'r') as f:
+            return int(f.readline().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def read_vdb_mtime(eroot: Path) -> typing.Optional[int]:
+    """Get mtime (in ns) of the vdb in `eroot`, None if missing"""
+
+    try:
+        return os.stat(eroot / VDB_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+
+def read_vdb_entry(path: Path) -> typing.Tuple[str, str]:
+    """Read (slot, repository) of the vdb entry at `path`"""
+
+    slot, repo, eapi = (read_file(path / fn)
+                        for fn in ('SLOT', 'repository', 'EAPI'))
+    return normalize_slot(slot, eapi), repo or ''
+
+
+def read_index(path: Path) -> typing.Optional[VdbIndex]:
+    """Read the index from `path`, return None if missing or invalid"""
+
+    packages: IndexEntries = {}
+    try:
+        with open(path, 'r') as f:
+            if f.readline().rstrip('\n') != INDEX_HEADER:
+                return None
+            key, counter = f.readline().split()
+            if key != 'counter':
+                return None
+            key, verified_mtime = f.readline().split()
+            if key != 'verified':
+                return None
+            for line in f:
+                cpv, slot, repo = line.split()
+                packages[cpv] = ('' if slot == EMPTY else slot,
+                                 '' if repo == EMPTY else repo)
+        return VdbIndex(int(counter), packages, int(verified_mtime))
+    except (OSError, ValueError):
+        return None
+
+
+def write_index(path: Path, index: VdbIndex) -> None:
+    """Write `index` to `path` atomically"""
+
+    lines = [INDEX_HEADER,
+             f'counter {index.counter}',
+             f'verified {index.verified_mtime}']
+    for cpv, (slot, repo) in sorted(index.packages.items()):
+        lines.append(f'{cpv} {slot or EMPTY} {repo or EMPTY}')
+    write_atomic(path, '\n'.join(lines) + '\n')
+
+
+def scan_index_entries(eroot: Path) -> IndexEntries:
+    """Read the entries for all packages installed in `eroot`"""
+
+    ret: IndexEntries = {}
+    vdb = eroot / VDB_PATH
+    try:
+        categories = list(os.scandir(vdb))
+    except FileNotFoundError:
+        return ret
+    for cat in categories:
+        if not cat.is_dir() or cat.name.startswith('.'):
+            continue
+        for name in list_category(vdb / cat.name):
+            cpv = f'{cat.name}/{name}'
+            ret[cpv] = read_vdb_entry(vdb / cpv)
+    return ret
+
+
+def verify_index(eroot: Path, index: VdbIndex) -> bool:
+    """
+    Check whether `index` lists exactly the packages installed in `eroot`
+
+    Only the vdb categories are listed, the package entries are not
+    read.
+    """
+
+    vdb = eroot / VDB_PATH
+    indexed: typing.Dict[str, typing.Set[str]] = {}
+    for cpv in index.packages:
+        cat, name = cpv.split('/', 1)
+        indexed.setdefault(cat, set()).add(name)
+    try:
+        categories = set(e.name for e in os.scandir(vdb)
+                         if e.is_dir() and not e.name.startswith('.'))
+    except FileNotFoundError:
+        categories = set()
+    return all(set(list_category(vdb / cat)) == indexed.get(cat, set())
+               for cat in categories | set(indexed))
+
+
+class IndexLock(object):
+    """Exclusive lock serializing index updates"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path.with_name(f'.{path.name}.lock')
+
+    def __enter__(self) -> 'IndexLock':
+        os.makedirs(self.path.parent, exist_ok=True)
+        self.f = open(self.path, 'w')
+        fcntl.lockf(self.f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args: typing.Any) -> None:
+        self.f.close()
+
+
+def rebuild_index(eroot: Path) -> VdbIndex:
+    """Rebuild the index for `eroot` from scratch"""
+
+    path = eroot / INDEX_PATH
+    with IndexLock(path):
+        # read the counter and mtime first, so that packages merged
+        # during the scan render the index inconsistent
+        counter = read_counter(eroot / COUNTER_PATH)
+        mtime = read_vdb_mtime(eroot)
+        index = VdbIndex(counter if counter is not None else -1,
+                         scan_index_entries(eroot),
+                         mtime if mtime is not None else 0)
+        write_index(path, index)
+    return index
+
+
+def update_index(eroot: Path,
+                 cpv: str,
+                 removed: bool = False
+                 ) -> None:
+    """
+    Update the index after `cpv` has been merged or unmerged
+
+    Called from post_pkg_postinst and post_pkg_postrm hooks.  After
+    a merge, the package's entry is added and the counter is updated.
+    If the package's COUNTER does not immediately follow the counter
+    recorded in the index, some merges were missed and the index
+    is rebuilt instead.  After an unmerge, the entry is removed
+    and the counter is left as-is (Portage does not bump it).
+    """
+
+    path = eroot / INDEX_PATH
+    with IndexLock(path):
+        index = read_index(path)
+        if removed:
+            if index is not None and cpv in index.packages:
+                del index.packages[cpv]
+                write_index(path, VdbIndex(index.counter, index.packages))
+            return
+
+        vdb_entry = eroot / VDB_PATH / cpv
+        pkg_counter = read_counter(vdb_entry / 'COUNTER')
+        if (index is not None and pkg_counter is not None
+                and pkg_counter == index.counter + 1):
+            index.packages[cpv] = read_vdb_entry(vdb_entry)
+            write_index(path, VdbIndex(pkg_counter, index.packages))
+            return
+
+    rebuild_index(eroot)
+
+
+def read_installed(eroot: Path) -> typing.Optional[typing.List[_pkg_str]]:
+    """
+    Get installed packages from the index
+
+    Return the packages listed in the index for `eroot`, or None if
+    the index is missing, or inconsistent with the vdb.  The counter
+    catches packages merged without running the hooks.  Unmerges
+    do not bump it, so the index is also verified against the vdb
+    whenever the vdb mtime (bumped by Portage on every merge
+    and unmerge) changes.  Since Portage bumps it after running
+    the hooks, this happens once after every merge.  The verified
+    mtime is recorded in the index if it is writable, so that
+    subsequent calls only read the index, the counter and the vdb
+    mtime.
+    """
+
+    path = eroot / INDEX_PATH
+    index = read_index(path)
+    if index is None:
+        return None
+    if read_counter(eroot / COUNTER_PATH) != index.counter:
+        return None
+    # read the mtime before verifying, so that changes during
+    # the verification are caught next time
+    mtime = read_vdb_mtime(eroot)
+    if mtime is None:
+        return None
+    if mtime != index.verified_mtime:
+        if not verify_index(eroot, index):
+            return None
+        try:
+            with IndexLock(path):
+                # unless the index has been updated in the meantime
+                if read_index(path) == index:
+                    write_index(path, index._replace(verified_mtime=mtime))
+        except OSError:
+            pass
+    ret = []
+    for cpv, (slot, repo) in index.packages.items():
+        try:
+            ret.append(_pkg_str(cpv, slot=slot,
+                                repo=repo or _unknown_repo))
+        except InvalidData:
+            # stray directories in the vdb
+            continue
+    return ret
+
+
+def install_hook(bashrc: Path) -> None:
+    """
+    Install the index hook into Portage's bashrc
+
+    Add the hook to `bashrc`, or replace the existing hook block.
+    Raise HookConflict if the remaining bashrc already defines
+    post_pkg_postinst or post_pkg_postrm.
+    """
+
+    try:
+        with open(bashrc, 'r') as f:
+            data = f.read()
+    except FileNotFoundError:
+        data = ''
+
+    begin = data.find(HOOK_BEGIN)
+    if begin != -1:
+        end = data.find(HOOK_END, begin)
+        if end == -1:
+            raise HookConflict(f'{bashrc}: unterminated hook block')
+        end = data.find('\n', end)
+        data = data[:begin] + data[end+1 if end != -1 else len(data):]
+        data = data.rstrip('\n') + '\n' if data.strip() else ''
+
+    if HOOK_FUNCTION_RE.search(data):
+        raise HookConflict(
+            f'{bashrc} defines post_pkg_postinst or post_pkg_postrm '
+            f'already, please merge the hook from the gander '
+            f'documentation into them manually')
+
+    if data:
+        data += '\n'
+    write_atomic(bashrc, data + BASHRC_HOOK)
@@ -0,0 +1,127 @@
+# (c) 2020 Michał Górny
+# 2-clause BSD license
+
+"""Parallel vdb scanner for high-latency filesystems"""
+
+import concurrent.futures
+import os
+import typing
+
+from pathlib import Path
+
+from portage.eapi import _get_eapi_attrs
+from portage.exception import InvalidData
+from portage.versions import (_get_slot_re, _pkg_str, _unknown_repo,
+                              cpv_getkey)
+
+from gander.background import Pacer
+
+
+MERGING_PREFIX = '-MERGING-'
+
+InstalledPackages = typing.Dict[_pkg_str, typing.Dict[str, str]]
+
+
+def normalize_slot(slot: typing.Optional[str],
+                   eapi: typing.Optional[str]
+                   ) -> str:
+    """Replace empty or invalid SLOT with 0, like vardbapi does"""
+
+    eapi_attrs = _get_eapi_attrs(eapi or '0')
+    if slot is None or _get_slot_re(eapi_attrs).match(slot) is None:
+        return '0'
+    return slot
+
+
+def list_category(path: Path) -> typing.List[str]:
+    """List package directories in vdb category at `path`"""
+
+    try:
+        return [e.name for e in os.scandir(path)
+                if not e.name.startswith(('.', MERGING_PREFIX))
+                and e.is_dir()]
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+
+
+def read_file(path: Path) -> typing.Optional[str]:
+    """Read stripped contents of `path`, return None if missing"""
+
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def scan_vdb(vdb: Path,
+             cps: typing.Collection[str],
+             keys: typing.Iterable[str],
+             jobs: int,
+             pacer: typing.Optional[Pacer] = None
+             ) -> InstalledPackages:
+    """
+    Read installed packages from the vdb in parallel
+
+    Find packages in `vdb` whose names are listed in `cps`, and read
+    their metadata `keys` (that must include SLOT and repository),
+    using up to `jobs` concurrent filesystem operations.  Only
+    the categories of `cps` are listed, and metadata reads are issued
+    as soon as a category listing completes, so that the wall clock
+    time is dominated by throughput rather than round-trip latency.
+
+    If `pacer` is specified, packages are read one at a time (their
+    files still in parallel), and `pacer` is called after every
+    package in order to throttle the reads.
+
+    Return a dict of packages along with their metadata, suitable
+    for match_world().
+    """
+
+    keys = list(keys)
+    # EAPI is needed to normalize SLOT
+    read_keys = keys + ['EAPI'] if 'EAPI' not in keys else keys
+    wanted = frozenset(cps)
+    categories = sorted(set(cp.split('/', 1)[0] for cp in wanted))
+    # cpv -> key -> pending read
+    reads: typing.Dict[str, typing.Dict[
+        str, concurrent.futures.Future[typing.Optional[str]]]] = {}
+
+    with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+        listings = {executor.submit(list_category, vdb / cat): cat
+                    for cat in categories}
+        for listing in concurrent.futures.as_completed(listings):
+            cat = listings[listing]
+            for name in listing.result():
+                cpv = f'{cat}/{name}'
+                try:
+                    if cpv_getkey(cpv) not in wanted:
+                        continue
+                except InvalidData:
+                    continue
+                reads[cpv] = {k: executor.submit(read_file, vdb / cpv / k)
+                              for k in read_keys}
+                if pacer is not None:
+                    concurrent.futures.wait(reads[cpv].values())
+                    pacer()
+
+        ret: InstalledPackages = {}
+        for cpv, futures in reads.items():
+            metadata = {}
+            for k, f in futures.items():
+                value = f.result()
+                if value is not None:
+                    metadata[k] = value
+            metadata['SLOT'] = normalize_slot(metadata.get('SLOT'),
+                                              metadata.get('EAPI'))
+            if 'EAPI' not in keys:
+                metadata.pop('EAPI', None)
+            try:
+                pkg = _pkg_str(
+                    cpv,
+                    slot=metadata.get('SLOT', ''),
+                    repo=metadata.get('repository') or _unknown_repo)
+            except InvalidData:
+                continue
+            ret[pkg] = metadata
+    return ret
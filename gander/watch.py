@@ -0,0 +1,321 @@
+# (c) 2020 Michał Górny
+# 2-clause BSD license
+
+"""Watch mode keeping the report up to date via inotify"""
+
+import ctypes
+import ctypes.util
+import errno
+import json
+import os
+import selectors
+import socket
+import struct
+import typing
+
+from pathlib import Path
+
+from portage.const import PROFILE_PATH, VDB_PATH, WORLD_FILE
+from portage.dep import Atom
+from portage.exception import InvalidData
+from portage.versions import cpv_getkey
+
+from gander.report import PortageAPI
+from gander.vdbscan import MERGING_PREFIX
+
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+# events signifying that a directory entry was added, removed
+# or replaced
+DIR_ENTRY_EVENTS = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+                    | IN_CREATE | IN_DELETE)
+
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifyEvent(typing.NamedTuple):
+    wd: int
+    mask: int
+    cookie: int
+    name: str
+
+
+class Inotify(object):
+    """Minimal inotify(7) wrapper using ctypes"""
+
+    def __init__(self) -> None:
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'),
+                                use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+    def add_watch(self,
+                  path: Path,
+                  mask: int
+                  ) -> int:
+        """Add a watch for `path` and return the watch descriptor"""
+
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path),
+                                         mask)
+        if wd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e), str(path))
+        return wd
+
+    def rm_watch(self, wd: int) -> None:
+        """Remove watch descriptor `wd`"""
+
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self) -> typing.List[InotifyEvent]:
+        """Read all pending events"""
+
+        ret = []
+        while True:
+            try:
+                buf = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos < len(buf):
+                wd, mask, cookie, length = (
+                    EVENT_HEADER.unpack_from(buf, pos))
+                pos += EVENT_HEADER.size
+                name = os.fsdecode(buf[pos:pos+length].rstrip(b'\0'))
+                pos += length
+                ret.append(InotifyEvent(wd, mask, cookie, name))
+        return ret
+
+
+def package_key(category: str,
+                name: str
+                ) -> typing.Optional[str]:
+    """
+    Get package name for vdb directory
+
+    Return the package name for vdb entry `name` in `category`,
+    or None if it is not a valid package directory name.
+    """
+
+    if name.startswith(MERGING_PREFIX):
+        name = name[len(MERGING_PREFIX):]
+    try:
+        return cpv_getkey(f'{category}/{name}')
+    except InvalidData:
+        return None
+
+
+class ReportWatcher(object):
+    """In-memory report updated incrementally"""
+
+    def __init__(self,
+                 config_root: typing.Optional[Path] = None
+                 ) -> None:
+        """
+        Instantiate the watcher and load the initial report
+
+        The Portage configuration is loaded from `config_root`
+        (as for PortageAPI).  Call add_watches() to set up inotify
+        watches, and process_events() to handle the events.
+        """
+
+        self.config_root = config_root
+        self.inotify = Inotify()
+        # watch descriptor -> (kind, path)
+        self.watches: typing.Dict[int, typing.Tuple[str, Path]] = {}
+        self.resolved: typing.Dict[Atom, typing.Optional[str]] = {}
+        self.reload()
+
+    def reload(self) -> None:
+        """Reload Portage configuration and resolve the whole @world"""
+
+        self.api = PortageAPI(config_root=self.config_root)
+        self.profile = self.api.profile
+        self.resolved = {}
+        self.update_world()
+
+    def resolve(self, atom: Atom) -> typing.Optional[str]:
+        """Resolve a single atom into package name or None"""
+
+        if self.api.match_installed(atom) is None:
+            return None
+        return atom.cp
+
+    def update_world(self) -> None:
+        """Update the atom list after @world set changed"""
+
+        atoms = set(self.api.world_atoms)
+        for x in set(self.resolved).difference(atoms):
+            del self.resolved[x]
+        for x in atoms.difference(self.resolved):
+            self.resolved[x] = self.resolve(x)
+
+    def update_packages(self,
+                        category: str,
+                        cps: typing.Optional[typing.Set[str]]
+                        ) -> None:
+        """
+        Update atoms after installed packages changed
+
+        Re-resolve atoms matching packages `cps` in `category`.  If
+        `cps` is None, all atoms in the category are re-resolved.
+        """
+
+        # the vdb caches are validated via mtimes, so clear them to
+        # avoid relying on timestamp granularity
+        self.api.vdb.dbapi._clear_cache()
+        for x in self.resolved:
+            if x.cp.split('/', 1)[0] != category:
+                continue
+            if cps is None or x.cp in cps:
+                self.resolved[x] = self.resolve(x)
+
+    @property
+    def world(self) -> typing.List[str]:
+        """Packages currently enabled via @world set"""
+
+        return sorted(set(x for x in self.resolved.values()
+                          if x is not None))
+
+    def watch(self,
+              kind: str,
+              path: Path,
+              mask: int = DIR_ENTRY_EVENTS
+              ) -> None:
+        try:
+            wd = self.inotify.add_watch(path, mask | IN_ONLYDIR)
+        except OSError as e:
+            if e.errno in (errno.ENOENT, errno.ENOTDIR):
+                return
+            raise
+        self.watches[wd] = (kind, path)
+
+    def add_watches(self) -> None:
+        """Set up inotify watches for all relevant paths"""
+
+        eroot = self.api.eroot
+        config_root = Path(self.api.dbapi.settings['PORTAGE_CONFIGROOT'])
+        profile_path = config_root / PROFILE_PATH
+        self.watch('config', profile_path.parent)
+        # make.profile symlink changes are caught via its parent
+        # directory, make.profile directory needs watching its contents
+        self.watch('profile', profile_path,
+                   DIR_ENTRY_EVENTS | IN_DONT_FOLLOW)
+        self.watch('world', (eroot / WORLD_FILE).parent)
+        vdb = eroot / VDB_PATH
+        self.watch('vdb', vdb)
+        try:
+            for cat in os.scandir(vdb):
+                if cat.is_dir(follow_symlinks=False):
+                    self.watch('category', Path(cat.path))
+        except FileNotFoundError:
+            pass
+
+    def process_events(self) -> None:
+        """Read pending inotify events and update the report"""
+
+        reload = False
+        world = False
+        categories: typing.Dict[str, typing.Optional[typing.Set[str]]] = {}
+
+        for ev in self.inotify.read_events():
+            if ev.mask & IN_Q_OVERFLOW:
+                reload = True
+                continue
+            if ev.mask & IN_IGNORED:
+                self.watches.pop(ev.wd, None)
+                continue
+            kind, path = self.watches.get(ev.wd, ('', Path()))
+            if kind == 'config' and ev.name == 'make.profile':
+                reload = True
+            elif kind == 'profile':
+                reload = True
+            elif kind == 'world' and ev.name in ('world', 'world_sets'):
+                world = True
+            elif kind == 'vdb' and ev.mask & IN_ISDIR:
+                if ev.mask & (IN_CREATE | IN_MOVED_TO):
+                    self.watch('category', path / ev.name)
+                categories[ev.name] = None
+            elif kind == 'category' and ev.mask & IN_ISDIR:
+                cps = categories.setdefault(path.name, set())
+                cp = package_key(path.name, ev.name)
+                if cp is None:
+                    categories[path.name] = None
+                elif cps is not None:
+                    cps.add(cp)
+
+        if reload:
+            self.reload()
+            for wd in list(self.watches):
+                del self.watches[wd]
+                self.inotify.rm_watch(wd)
+            self.add_watches()
+            return
+        if world:
+            self.update_world()
+        for cat, cps in categories.items():
+            self.update_packages(cat, cps)
+
+
+def serve(watcher: ReportWatcher,
+          socket_path: Path,
+          get_report: typing.Callable[[ReportWatcher],
+                                      typing.Dict[str, typing.Any]]
+          ) -> None:
+    """
+    Serve the report over unix socket at `socket_path`
+
+    Process inotify events and send the report returned
+    by `get_report` to every client connecting to the socket.
+    Runs until interrupted.
+    """
+
+    try:
+        os.unlink(socket_path)
+    except FileNotFoundError:
+        pass
+    os.makedirs(socket_path.parent, exist_ok=True)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(str(socket_path))
+        try:
+            sock.listen()
+            watcher.add_watches()
+            with selectors.DefaultSelector() as sel:
+                sel.register(watcher.inotify, selectors.EVENT_READ)
+                sel.register(sock, selectors.EVENT_READ)
+                while True:
+                    for key, events in sel.select():
+                        if key.fileobj is sock:
+                            conn, _ = sock.accept()
+                            with conn:
+                                data = json.dumps(get_report(watcher),
+                                                  indent=2)
+                                try:
+                                    conn.sendall(f'{data}\n'.encode())
+                                except OSError:
+                                    pass
+                        else:
+                            watcher.process_events()
+        finally:
+            os.unlink(socket_path)
@@ -0,0 +1,145 @@
+# (c) 2020 Michał Górny
+# 2-clause BSD license
+
+"""Minimal squashfs 4.0 writer for test images"""
+
+import os
+import stat
+import struct
+import typing
+
+from pathlib import Path
+
+
+METADATA_SIZE = 8192
+METADATA_UNCOMPRESSED = 0x8000
+BLOCK_LOG = 17
+BLOCK_UNCOMPRESSED = 1 << 24
+INVALID = 0xffffffffffffffff
+INVALID_FRAG = 0xffffffff
+
+COMPRESSION_GZIP = 1
+FLAGS = (0x01  # uncompressed inodes
+         | 0x02  # uncompressed data
+         | 0x08  # uncompressed fragments
+         | 0x10)  # no fragments
+
+TYPE_DIR = 1
+TYPE_FILE = 2
+TYPE_SYMLINK = 3
+
+
+class MetadataWriter(object):
+    """Stream split into uncompressed metadata blocks"""
+
+    def __init__(self) -> None:
+        self.data = bytearray()
+
+    def ref(self) -> typing.Tuple[int, int]:
+        """Get (block start, offset) of the current position"""
+
+        block, offset = divmod(len(self.data), METADATA_SIZE)
+        return (block * (METADATA_SIZE + 2), offset)
+
+    def getvalue(self) -> bytes:
+        ret = bytearray()
+        for i in range(0, len(self.data), METADATA_SIZE):
+            block = self.data[i:i + METADATA_SIZE]
+            ret += struct.pack('<H', len(block) | METADATA_UNCOMPRESSED)
+            ret += block
+        return bytes(ret)
+
+
+def write_squashfs(root: Path, path: Path) -> None:
+    """
+    Create uncompressed squashfs image of directory tree at `root`
+
+    Only directories, regular files and symlinks are supported.
+    The image is written to `path`.
+    """
+
+    block_size = 1 << BLOCK_LOG
+    data = bytearray()
+    inodes = MetadataWriter()
+    dirs = MetadataWriter()
+
+    numbers: typing.Dict[str, int] = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in sorted(dirnames + filenames):
+            numbers[os.path.join(dirpath, name)] = len(numbers) + 1
+    numbers[str(root)] = len(numbers) + 1
+    inode_count = len(numbers)
+
+    def header(inode_type: int, st: os.stat_result, fspath: str) -> bytes:
+        return struct.pack('<HHHHII', inode_type, stat.S_IMODE(st.st_mode),
+                           0, 0, 0, numbers[fspath])
+
+    def add(fspath: str, parent: int) -> typing.Tuple[int, int, int]:
+        """Write inode for `fspath`, return (type, block, offset)"""
+
+        st = os.lstat(fspath)
+        if stat.S_ISDIR(st.st_mode):
+            listing = bytearray()
+            subdirs = 0
+            for name in sorted(os.listdir(fspath)):
+                child = os.path.join(fspath, name)
+                inode_type, block, offset = add(child, numbers[fspath])
+                if inode_type == TYPE_DIR:
+                    subdirs += 1
+                encoded = name.encode()
+                listing += struct.pack('<III', 0, block, numbers[child])
+                listing += struct.pack('<HhHH', offset, 0, inode_type,
+                                       len(encoded) - 1) + encoded
+            dir_block, dir_offset = dirs.ref()
+            dirs.data += listing
+            inode_type = TYPE_DIR
+            inode = struct.pack('<IIHHI', dir_block, subdirs + 2,
+                                len(listing) + 3, dir_offset, parent)
+        elif stat.S_ISLNK(st.st_mode):
+            target = os.readlink(fspath).encode()
+            inode_type = TYPE_SYMLINK
+            inode = struct.pack('<II', 1, len(target)) + target
+        elif stat.S_ISREG(st.st_mode):
+            with open(fspath, 'rb') as f:
+                contents = f.read()
+            blocks = [contents[i:i + block_size]
+                      for i in range(0, len(contents), block_size)]
+            inode_type = TYPE_FILE
+            inode = struct.pack('<IIII', 96 + len(data), INVALID_FRAG, 0,
+                                len(contents))
+            for b in blocks:
+                inode += struct.pack('<I', len(b) | BLOCK_UNCOMPRESSED)
+                data.extend(b)
+        else:
+            raise NotImplementedError(f'Unsupported file type: {fspath}')
+
+        block, offset = inodes.ref()
+        inodes.data += header(inode_type, st, fspath) + inode
+        return (inode_type, block, offset)
+
+    _, root_block, root_offset = add(str(root), inode_count + 1)
+
+    inode_table_start = 96 + len(data)
+    inode_table = inodes.getvalue()
+    directory_table_start = inode_table_start + len(inode_table)
+    directory_table = dirs.getvalue()
+    id_block_start = directory_table_start + len(directory_table)
+    id_block = struct.pack('<HI', 4 | METADATA_UNCOMPRESSED, 0)
+    id_table_start = id_block_start + len(id_block)
+    id_table = struct.pack('<Q', id_block_start)
+    bytes_used = id_table_start + len(id_table)
+
+    superblock = struct.pack(
+        '<4sIIIIHHHHHHQQQQQQQQ',
+        b'hsqs', inode_count, 0, block_size, 0, COMPRESSION_GZIP,
+        BLOCK_LOG, FLAGS, 1, 4, 0, root_block << 16 | root_offset,
+        bytes_used, id_table_start, INVALID, inode_table_start,
+        directory_table_start, id_block_start, INVALID)
+
+    with open(path, 'wb') as f:
+        f.write(superblock)
+        f.write(data)
+        f.write(inode_table)
+        f.write(directory_table)
+        f.write(id_block)
+        f.write(id_table)
@@ -0,0 +1,72 @@
+# (c) 2020 Michał Górny
+# 2-clause BSD license
+
+"""Tests for background mode"""
+
+import multiprocessing
+import os
+import typing
+import unittest
+
+from unittest.mock import patch, MagicMock
+
+from gander.background import (BackgroundMode,
+                               Pacer,
+                               set_idle_io_priority,
+                               )
+
+
+def enter_background() -> typing.Tuple[int, typing.List[str]]:
+    background = BackgroundMode()
+    background.enter()
+    return os.nice(0), background.applied
+
+
+class PacerTests(unittest.TestCase):
+    @patch('gander.background.time')
+    def test_pacing(self, mock_time: MagicMock) -> None:
+        mock_time.monotonic.side_effect = [0.0, 0.1, 0.1, 0.101, 0.101]
+        pacer = Pacer(duty_cycle=0.25)
+        # 0.1 s of work requires 0.3 s of sleep
+        pacer()
+        mock_time.sleep.assert_called_once()
+        self.assertAlmostEqual(mock_time.sleep.call_args[0][0], 0.3)
+        # 1 ms of work gets accumulated
+        pacer()
+        mock_time.sleep.assert_called_once()
+        self.assertEqual(pacer.steps, 2)
+        self.assertAlmostEqual(pacer.throttled, 0.3)
+        self.assertAlmostEqual(pacer.debt, 0.003)
+
+    @patch('gander.background.time')
+    def test_start(self, mock_time: MagicMock) -> None:
+        mock_time.monotonic.side_effect = [0.0, 5.0, 5.1, 5.1]
+        pacer = Pacer(duty_cycle=0.25)
+        # time until start() is not accounted
+        pacer.start()
+        pacer()
+        mock_time.sleep.assert_called_once()
+        self.assertAlmostEqual(mock_time.sleep.call_args[0][0], 0.3)
+
+
+class BackgroundModeTests(unittest.TestCase):
+    @patch('gander.background.platform.machine')
+    def test_ioprio_unknown_arch(self, machine: MagicMock) -> None:
+        machine.return_value = 'unknown'
+        self.assertFalse(set_idle_io_priority())
+
+    def test_enter(self) -> None:
+        # run in a subprocess not to affect the test runner
+        with multiprocessing.get_context('fork').Pool(1) as pool:
+            niceness, applied = pool.apply(enter_background)
+        self.assertEqual(niceness, 19)
+        self.assertIn('nice 19', applied)
+
+    def test_summary(self) -> None:
+        background = BackgroundMode(duty_cycle=0.5)
+        background.applied = ['nice 19']
+        background.pacer.steps = 3
+        background.pacer.throttled = 1.5
+        self.assertEqual(background.summary(),
+                         'priorities: nice 19; throttled for 1.50 s over '
+                         '3 steps (50% duty cycle)')
@@ -0,0 +1,125 @@
+# (c) 2020 Michał Górny
+# 2-clause BSD license
+
+"""Tests for binary package index support"""
+
+import io
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from gander.binhost import BinhostAPI, iter_stanzas
+
+
+PACKAGES_HEADER = '''ACCEPT_KEYWORDS: amd64
+ARCH: amd64
+CHOST: x86_64-pc-linux-gnu
+PACKAGES: 4
+PROFILE: default/linux/amd64
+REPO: gentoo
+TIMESTAMP: 1600000000
+VERSION: 0
+
+'''
+
+PACKAGES_BODY = '''BUILD_TIME: 1600000000
+CPV: dev-libs/foo-1
+SLOT: 0
+
+BUILD_TIME: 1600000000
+CPV: dev-libs/bar-2-r1
+REPO: gentoo
+SLOT: 0
+
+CPV: dev-libs/baz-3
+REPO: fancy
+SLOT: 0
+
+CPV: dev-util/frobnicate-1.2
+SLOT: 1
+'''
+
+
+class IterStanzasTests(unittest.TestCase):
+    def test_stanzas(self) -> None:
+        buf = io.BytesIO(b'A: 1\nB: 2\n\n\nC: with: colon\n'
+                         b'invalid\nD:\n')
+        self.assertEqual(
+            list(iter_stanzas(buf)),
+            [{'A': '1', 'B': '2'},
+             {'C': 'with: colon', 'D': ''}])
+
+    def test_empty(self) -> None:
+        self.assertEqual(list(iter_stanzas(io.BytesIO(b''))), [])
+
+
+class BinhostAPITests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tempdir.name) / 'Packages'
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def create(self, data: str) -> BinhostAPI:
+        with open(self.path, 'w') as f:
+            f.write(data)
+        return BinhostAPI(self.path)
+
+    def test_profile(self) -> None:
+        api = self.create(PACKAGES_HEADER + PACKAGES_BODY)
+        self.assertEqual(api.profile, 'default/linux/amd64')
+
+    def test_profile_missing(self) -> None:
+        api = self.create('VERSION: 0\n\n' + PACKAGES_BODY)
+        self.assertIsNone(api.profile)
+
+    def test_profile_nongentoo(self) -> None:
+        api = self.create('PROFILE: /var/db/repos/fancy/profiles/foo'
+                          '\n\n')
+        self.assertIsNone(api.profile)
+
+    def test_world(self) -> None:
+        api = self.create(PACKAGES_HEADER + PACKAGES_BODY)
+        self.assertEqual(api.world, [
+            'dev-libs/bar',
+            'dev-libs/foo',
+            'dev-util/frobnicate',
+        ])
+
+    def test_world_foreign_header(self) -> None:
+        api = self.create(PACKAGES_HEADER.replace('REPO: gentoo',
+                                                  'REPO: fancy')
+                          + PACKAGES_BODY)
+        self.assertEqual(api.world, ['dev-libs/bar'])
+
+    def test_world_duplicate(self) -> None:
+        api = self.create(PACKAGES_HEADER
+                          + 'CPV: dev-libs/foo-1\nBUILD_ID: 1\n\n'
+                          + 'CPV: dev-libs/foo-1\nBUILD_ID: 2\n\n'
+                          + 'CPV: dev-libs/foo-2\n')
+        self.assertEqual(api.world, ['dev-libs/foo'])
+
+    def test_world_invalid_cpv(self) -> None:
+        api = self.create(PACKAGES_HEADER
+                          + 'CPV: garbage\n\n'
+                          + 'CPV: dev-libs/foo-1\n')
+        self.assertEqual(api.world, ['dev-libs/foo'])
+
+    def test_world_extended(self) -> None:
+        api = self.create(PACKAGES_HEADER
+                          + 'CPV: dev-libs/foo-1\nUSE: b a\n\n'
+                          + 'CPV: dev-libs/foo-2\nSLOT: 2\n\n'
+                          + 'CPV: dev-libs/bar-1\nREPO: fancy\n')
+        self.assertEqual(api.get_world(['version', 'slot', 'use']), (
+            ['dev-libs/foo'],
+            {'dev-libs/foo': [
+                {'version': '1', 'slot': '0', 'use': ['a', 'b']},
+                {'version': '2', 'slot': '2', 'use': []},
+            ]}))
+
+    def test_empty(self) -> None:
+        api = self.create('')
+        self.assertIsNone(api.profile)
+        self.assertEqual(api.world, [])
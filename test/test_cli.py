@@ -7,6 +7,7 @@ import io
 import json
 import os
 import tempfile
+import time
 import typing
 import unittest
 
@@ -16,11 +17,17 @@ from unittest.mock import patch, MagicMock
 from requests.models import PreparedRequest
 import responses
 
-from gander.__main__ import (get_default_machine_id_path,
+from gander.__main__ import (DEADLINE_EXIT_STATUS,
+                             get_default_machine_id_path,
                              main,
                              MACHINE_ID_RE,
                              )
-from gander.privacy import PRIVACY_POLICY
+from gander.privacy import (PRIVACY_POLICY,
+                            PRIVACY_POLICY_HASH,
+                            PRIVACY_POLICY_VERSION,
+                            )
+from gander.provision import read_accepted_policy
+from gander.vdbindex import BASHRC_HOOK, INDEX_PATH, read_index
 
 from test.repo import EbuildRepositoryTestCase
 
@@ -101,6 +108,8 @@ class CLIBareTests(unittest.TestCase):
             if exit_status == 0:
                 with open(machine_id_path) as f:
                     self.assertRegex(f.read().strip(), MACHINE_ID_RE)
+                self.assertEqual(read_accepted_policy(machine_id_path),
+                                 PRIVACY_POLICY_VERSION)
             else:
                 self.assertFalse(machine_id_path.exists())
 
@@ -118,6 +127,226 @@ class CLIBareTests(unittest.TestCase):
     def test_setup_n(self) -> None:
         self.assert_setup(exit_status=1)
 
+    def assert_setup_noninteractive(self,
+                                    args: typing.List[str],
+                                    exit_status: int = 0
+                                    ) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            machine_id_path = Path(tempdir) / 'machine-id'
+            self.assertEqual(
+                main(['--setup',
+                      '--machine-id-path', str(machine_id_path)]
+                     + args),
+                exit_status)
+            self.assertEqual(machine_id_path.exists(), exit_status == 0)
+
+    @patch('gander.__main__.sys.stdout', new_callable=io.StringIO)
+    def test_setup_accept_version(self, sout: io.StringIO) -> None:
+        self.assert_setup_noninteractive(
+            ['--accept-policy', str(PRIVACY_POLICY_VERSION)])
+        self.assertNotIn(PRIVACY_POLICY, sout.getvalue())
+
+    @patch('gander.__main__.sys.stdout', new_callable=io.StringIO)
+    def test_setup_accept_hash(self, sout: io.StringIO) -> None:
+        self.assert_setup_noninteractive(
+            ['--accept-policy', PRIVACY_POLICY_HASH])
+
+    @patch('gander.__main__.sys.stderr', new_callable=io.StringIO)
+    def test_setup_accept_mismatch(self, serr: io.StringIO) -> None:
+        self.assert_setup_noninteractive(
+            ['--accept-policy', '0'], exit_status=1)
+        self.assertIn(PRIVACY_POLICY_HASH, serr.getvalue())
+
+    @patch('gander.__main__.sys.stderr', new_callable=io.StringIO)
+    @patch('gander.__main__.sys.stdout', new_callable=io.StringIO)
+    def test_profile_out(self,
+                         sout: io.StringIO,
+                         serr: io.StringIO
+                         ) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = Path(tempdir) / 'prof'
+            self.assertEqual(
+                main(['--profile-out', str(path), '--privacy-policy']),
+                0)
+            self.assertTrue(Path(f'{path}.pstats').exists())
+            self.assertTrue(Path(f'{path}.folded').exists())
+        self.assertIn(PRIVACY_POLICY, sout.getvalue())
+        self.assertIn('Profile summary: ', serr.getvalue())
+
+    @patch('gander.__main__.sys.stderr', new_callable=io.StringIO)
+    def test_jobs_not_positive(self, serr: io.StringIO) -> None:
+        for value in ('0', '-1', 'foo'):
+            with self.assertRaises(SystemExit) as cm:
+                main(['--make-reports', '--roots', '-', '--jobs', value])
+            self.assertEqual(cm.exception.code, 2)
+            self.assertIn('--jobs', serr.getvalue())
+
+    @patch('gander.__main__.sys.stderr', new_callable=io.StringIO)
+    def test_scan_jobs_not_positive(self, serr: io.StringIO) -> None:
+        with self.assertRaises(SystemExit) as cm:
+            main(['--make-report', '--scan-jobs', '0'])
+        self.assertEqual(cm.exception.code, 2)
+        self.assertIn('--scan-jobs', serr.getvalue())
+
+    @responses.activate
+    @patch('gander.__main__.sys.stdout', new_callable=io.StringIO)
+    def test_submit_batch(self, sout: io.StringIO) -> None:
+        responses.add('PUT', 'http://example.com/submit', status=200)
+        responses.add('PUT', 'http://example.com/submit', status=429)
+        with tempfile.TemporaryDirectory() as tempdir:
+            batch_path = Path(tempdir) / 'reports.jsonl'
+            with open(batch_path, 'w') as f:
+                for i in range(2):
+                    json.dump({'id': f'{i}' * 32}, f)
+                    f.write('\n')
+            self.assertEqual(
+                main(['--submit-batch', '--reports', str(batch_path),
+                      '--jobs', '1',
+                      '--api-endpoint', 'http://example.com/submit']),
+                1)
+        self.assertEqual(
+            sout.getvalue().splitlines(),
+            [f'1: {"0" * 32}: accepted (200)',
+             f'2: {"1" * 32}: rejected: Please wait 7 days between '
+             f'successive submissions. (429)'])
+
+    @patch('gander.__main__.sys.stderr', new_callable=io.StringIO)
+    def test_submit_batch_no_reports(self, serr: io.StringIO) -> None:
+        self.assertEqual(main(['--submit-batch']), 1)
+        self.assertIn('--reports', serr.getvalue())
+
+    def test_update_vdb_index(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            vdir = Path(tempdir) / 'var/db/pkg/dev-libs/foo-1'
+            os.makedirs(vdir)
+            with open(vdir / 'repository', 'w') as f:
+                f.write('gentoo\n')
+            self.assertEqual(
+                main(['--update-vdb-index', '--cpv', 'dev-libs/foo-1',
+                      '--eroot', tempdir]),
+                0)
+            index = read_index(Path(tempdir) / INDEX_PATH)
+            assert index is not None
+            self.assertEqual(index.packages,
+                             {'dev-libs/foo-1': ('0', 'gentoo')})
+
+            self.assertEqual(
+                main(['--update-vdb-index', '--cpv', 'dev-libs/foo-1',
+                      '--eroot', tempdir, '--removed']),
+                0)
+            index = read_index(Path(tempdir) / INDEX_PATH)
+            assert index is not None
+            self.assertEqual(index.packages, {})
+
+    @patch('gander.__main__.sys.stderr', new_callable=io.StringIO)
+    def test_update_vdb_index_no_cpv(self, serr: io.StringIO) -> None:
+        self.assertEqual(main(['--update-vdb-index']), 1)
+        self.assertIn('--cpv', serr.getvalue())
+
+    @patch('gander.__main__.sys.stdout', new_callable=io.StringIO)
+    def test_setup_roots(self, sout: io.StringIO) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            roots_path = Path(tempdir) / 'roots'
+            with open(roots_path, 'w') as f:
+                f.write('a\n# comment\n\nb\n')
+            for root in ('a', 'b'):
+                os.makedirs(Path(tempdir) / 'machines' / root)
+            self.assertEqual(
+                main(['--setup',
+                      '--accept-policy', str(PRIVACY_POLICY_VERSION),
+                      '--roots', str(roots_path),
+                      '--root-format', f'{tempdir}/machines/{{}}']),
+                0)
+            for root in ('a', 'b'):
+                with open(Path(tempdir) / 'machines' / root / 'etc'
+                          / 'gander.id') as f:
+                    self.assertRegex(f.read().strip(), MACHINE_ID_RE)
+        self.assertEqual(len(sout.getvalue().splitlines()), 2)
+
+    @patch('gander.__main__.sys.stderr', new_callable=io.StringIO)
+    @patch('gander.__main__.sys.stdout', new_callable=io.StringIO)
+    def test_setup_roots_missing(self,
+                                 sout: io.StringIO,
+                                 serr: io.StringIO
+                                 ) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            roots_path = Path(tempdir) / 'roots'
+            with open(roots_path, 'w') as f:
+                f.write('typo\n')
+            self.assertEqual(
+                main(['--setup',
+                      '--accept-policy', str(PRIVACY_POLICY_VERSION),
+                      '--roots', str(roots_path),
+                      '--root-format', f'{tempdir}/machines/{{}}']),
+                1)
+            self.assertFalse((Path(tempdir) / 'machines').exists())
+        self.assertIn('not an existing directory', serr.getvalue())
+
+    @patch('gander.__main__.sys.stderr', new_callable=io.StringIO)
+    def test_setup_roots_no_accept(self, serr: io.StringIO) -> None:
+        self.assert_setup_noninteractive(
+            ['--roots', '-'], exit_status=1)
+
+    @patch('gander.__main__.sys.stdout', new_callable=io.StringIO)
+    def test_make_report_binhost(self, sout: io.StringIO) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            index_path = Path(tempdir) / 'Packages'
+            with open(index_path, 'w') as f:
+                f.write('PROFILE: default/linux/amd64\n'
+                        'REPO: gentoo\n\n'
+                        'CPV: dev-libs/foo-1\n\n'
+                        'CPV: dev-libs/bar-1\nREPO: fancy\n')
+            self.assertEqual(
+                main(['--make-report',
+                      '--binhost-index', str(index_path),
+                      '--machine-id-path',
+                      str(Path(tempdir) / 'machine-id')]),
+                0)
+        self.assertEqual(json.loads(sout.getvalue()), {
+            'goose-version': 1,
+            'profile': 'default/linux/amd64',
+            'world': ['dev-libs/foo'],
+        })
+
+    def make_binhost_report(self,
+                            extra_args: typing.List[str] = []
+                            ) -> typing.Dict[str, typing.Any]:
+        with patch('gander.__main__.sys.stdout',
+                   new_callable=io.StringIO) as sout:
+            with tempfile.TemporaryDirectory() as tempdir:
+                index_path = Path(tempdir) / 'Packages'
+                with open(index_path, 'w') as f:
+                    f.write('REPO: gentoo\n\n'
+                            'CPV: dev-libs/foo-1\nSLOT: 1\nUSE: a\n')
+                self.assertEqual(
+                    main(['--make-report',
+                          '--binhost-index', str(index_path),
+                          '--machine-id-path',
+                          str(Path(tempdir) / 'machine-id')]
+                         + extra_args),
+                    0)
+            return json.loads(sout.getvalue())
+
+    @patch('gander.__main__.POLICY_EXTENDED_FIELDS',
+           new={1: frozenset(['version', 'slot'])})
+    def test_make_report_extended(self) -> None:
+        self.assertEqual(
+            self.make_binhost_report(['--extended'])['world-details'],
+            {'dev-libs/foo': [{'version': '1', 'slot': '1'}]})
+
+    @patch('gander.__main__.POLICY_EXTENDED_FIELDS',
+           new={1: frozenset(['version', 'slot'])})
+    def test_make_report_extended_not_requested(self) -> None:
+        self.assertNotIn('world-details', self.make_binhost_report())
+
+    @patch('gander.__main__.sys.stderr', new_callable=io.StringIO)
+    def test_make_report_extended_not_permitted(self,
+                                                serr: io.StringIO
+                                                ) -> None:
+        self.assertNotIn('world-details',
+                         self.make_binhost_report(['--extended']))
+        self.assertIn('does not permit', serr.getvalue())
+
 
 class CLIRepoTests(EbuildRepositoryTestCase):
     expected_report = {
@@ -139,6 +368,37 @@ class CLIRepoTests(EbuildRepositoryTestCase):
         for x in packages:
             self.create_vdb_package(f'{x}-1')
 
+    @patch('gander.__main__.sys.stdout', new_callable=io.StringIO)
+    def test_install_hook(self, sout: io.StringIO) -> None:
+        root = Path(self.tempdir.name)
+        machine_id_path = root / 'machine-id'
+        with open(machine_id_path, 'w') as f:
+            f.write('0123456789abcdef0123456789abcdef\n')
+        self.assertEqual(
+            main(['--install-hook',
+                  '--config-root', str(root),
+                  '--machine-id-path', str(machine_id_path)]),
+            0)
+        with open(root / 'etc/portage/bashrc') as f:
+            self.assertEqual(f.read(), BASHRC_HOOK)
+        index = read_index(root / INDEX_PATH)
+        assert index is not None
+        self.assertEqual(len(index.packages), 3)
+        # the machine id is kept
+        with open(machine_id_path) as f:
+            self.assertEqual(f.read(), '0123456789abcdef0123456789abcdef\n')
+
+    @patch('gander.__main__.sys.stderr', new_callable=io.StringIO)
+    def test_install_hook_roots(self, serr: io.StringIO) -> None:
+        root = Path(self.tempdir.name)
+        self.assertEqual(
+            main(['--install-hook',
+                  '--config-root', str(root),
+                  '--roots', '-']),
+            1)
+        self.assertIn('--roots', serr.getvalue())
+        self.assertFalse((root / 'etc/portage/bashrc').exists())
+
     @patch('gander.__main__.sys.stdout', new_callable=io.StringIO)
     def test_make_report(self, sout: io.StringIO) -> None:
         machine_id_path = Path(self.tempdir.name) / 'machine-id'
@@ -153,6 +413,21 @@ class CLIRepoTests(EbuildRepositoryTestCase):
         self.assertEqual(json.loads(sout.getvalue()),
                          self.expected_report)
 
+    @patch('gander.__main__.sys.stdout', new_callable=io.StringIO)
+    def test_make_report_scan_jobs(self, sout: io.StringIO) -> None:
+        machine_id_path = Path(self.tempdir.name) / 'machine-id'
+        with open(machine_id_path, 'w') as f:
+            f.write('0123456789abcdef0123456789abcdef\n')
+
+        self.assertEqual(
+            main(['--make-report',
+                  '--config-root', self.tempdir.name,
+                  '--machine-id-path', str(machine_id_path),
+                  '--scan-jobs', '4']),
+            0)
+        self.assertEqual(json.loads(sout.getvalue()),
+                         self.expected_report)
+
     @patch('gander.__main__.sys.stdout', new_callable=io.StringIO)
     def test_make_report_invalid_id(self, sout: io.StringIO) -> None:
         machine_id_path = Path(self.tempdir.name) / 'machine-id'
@@ -184,6 +459,88 @@ class CLIRepoTests(EbuildRepositoryTestCase):
             json.loads(sout.getvalue()),
             expected)
 
+    @patch('gander.__main__.sys.stderr', new_callable=io.StringIO)
+    @patch('gander.__main__.sys.stdout', new_callable=io.StringIO)
+    def test_make_reports(self,
+                          sout: io.StringIO,
+                          serr: io.StringIO
+                          ) -> None:
+        tempdir = Path(self.tempdir.name)
+        with open(tempdir / 'etc' / 'gander.id', 'w') as f:
+            f.write('0123456789abcdef0123456789abcdef\n')
+        roots_path = tempdir / 'roots'
+        with open(roots_path, 'w') as f:
+            f.write(f'{tempdir}\n{tempdir}/missing\n')
+
+        self.assertEqual(
+            main(['--make-reports',
+                  '--config-root', self.tempdir.name,
+                  '--roots', str(roots_path),
+                  '--jobs', '2']),
+            1)
+        self.assertEqual(
+            [json.loads(x) for x in sout.getvalue().splitlines()],
+            [self.expected_report])
+        self.assertIn(f'{tempdir}/missing: ', serr.getvalue())
+
+    def make_report_deadline(self,
+                             sout: io.StringIO,
+                             serr: io.StringIO,
+                             cache: Path,
+                             slow: bool
+                             ) -> int:
+        def slow_build_report(*args: typing.Any) -> None:
+            while True:
+                time.sleep(0.01)
+
+        sout.truncate(0)
+        sout.seek(0)
+        serr.truncate(0)
+        serr.seek(0)
+        argv = ['--make-report',
+                '--config-root', self.tempdir.name,
+                '--machine-id-path',
+                str(Path(self.tempdir.name) / 'machine-id'),
+                '--report-cache', str(cache)]
+        if not slow:
+            # generous deadline, so that slow machines do not time out
+            return main(argv + ['--deadline', '60'])
+        # do not load the configuration, so that only world resolution
+        # can exceed the deadline
+        with patch('gander.__main__.get_api'), \
+                patch('gander.__main__.build_report',
+                      side_effect=slow_build_report):
+            return main(argv + ['--deadline', '0.2'])
+
+    @patch('gander.__main__.sys.stderr', new_callable=io.StringIO)
+    @patch('gander.__main__.sys.stdout', new_callable=io.StringIO)
+    def test_make_report_deadline(self,
+                                  sout: io.StringIO,
+                                  serr: io.StringIO
+                                  ) -> None:
+        with open(Path(self.tempdir.name) / 'machine-id', 'w') as f:
+            f.write('0123456789abcdef0123456789abcdef\n')
+        cache = Path(self.tempdir.name) / 'cache' / 'report.json'
+        self.assertEqual(
+            self.make_report_deadline(sout, serr, cache, slow=True),
+            DEADLINE_EXIT_STATUS)
+        self.assertEqual(sout.getvalue(), '')
+        self.assertIn('world resolution', serr.getvalue())
+        self.assertIn('no cached report', serr.getvalue())
+
+        self.assertEqual(
+            self.make_report_deadline(sout, serr, cache, slow=False),
+            0)
+        self.assertEqual(json.loads(sout.getvalue()),
+                         self.expected_report)
+
+        self.assertEqual(
+            self.make_report_deadline(sout, serr, cache, slow=True),
+            0)
+        self.assertEqual(json.loads(sout.getvalue()),
+                         self.expected_report)
+        self.assertIn('using the cached report', serr.getvalue())
+
     @responses.activate
     def test_submit_report_missing_id(self) -> None:
         machine_id_path = Path(self.tempdir.name) / 'machine-id'
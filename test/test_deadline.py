@@ -0,0 +1,103 @@
+# (c) 2020 Michał Górny
+# 2-clause BSD license
+
+"""Tests for deadline handling"""
+
+import json
+import signal
+import tempfile
+import time
+import typing
+import unittest
+
+from pathlib import Path
+
+from gander.deadline import (Deadline,
+                             DeadlineExceeded,
+                             read_cached_report,
+                             write_cached_report,
+                             )
+
+
+class DeadlineTests(unittest.TestCase):
+    def test_unlimited(self) -> None:
+        deadline = Deadline(None)
+        with deadline.phase('test'):
+            pass
+        self.assertIsNone(deadline.remaining())
+        self.assertEqual(signal.getitimer(signal.ITIMER_REAL), (0.0, 0.0))
+        self.assertEqual([p.name for p in deadline.phases], ['test'])
+
+    def test_within_budget(self) -> None:
+        deadline = Deadline(10)
+        with deadline.phase('test'):
+            pass
+        self.assertEqual(signal.getitimer(signal.ITIMER_REAL), (0.0, 0.0))
+        self.assertIs(signal.getsignal(signal.SIGALRM), signal.SIG_DFL)
+        self.assertFalse(deadline.phases[0].interrupted)
+
+    def test_exceeded(self) -> None:
+        deadline = Deadline(0.05)
+        with deadline.phase('fast'):
+            pass
+        with self.assertRaises(DeadlineExceeded):
+            with deadline.phase('slow'):
+                while True:
+                    time.sleep(0.01)
+        self.assertEqual([(p.name, p.interrupted) for p in deadline.phases],
+                         [('fast', False), ('slow', True)])
+        self.assertIs(signal.getsignal(signal.SIGALRM), signal.SIG_DFL)
+        self.assertRegex(deadline.summary(),
+                         r'^deadline of 0\.05 s, [0-9.]+ s elapsed: '
+                         r'fast [0-9.]+ s, slow [0-9.]+ s \(interrupted\)$')
+
+    def test_reserve(self) -> None:
+        deadline = Deadline(1)
+        with self.assertRaises(DeadlineExceeded):
+            with deadline.phase('test', reserve=1):
+                self.fail('phase not interrupted')
+        self.assertTrue(deadline.phases[0].interrupted)
+
+    def test_not_swallowed(self) -> None:
+        deadline = Deadline(0.05)
+        with self.assertRaises(DeadlineExceeded):
+            with deadline.phase('test'):
+                try:
+                    time.sleep(1)
+                except Exception:
+                    self.fail('DeadlineExceeded caught as Exception')
+
+
+class ReportCacheTests(unittest.TestCase):
+    key: typing.Dict[str, typing.Any] = {'config-root': None, 'fields': []}
+    report: typing.Dict[str, typing.Any] = {
+        'goose-version': 1, 'profile': None, 'world': []}
+
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tempdir.name) / 'cache' / 'report.json'
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_round_trip(self) -> None:
+        write_cached_report(self.path, self.key, self.report)
+        cached = read_cached_report(self.path, self.key)
+        assert cached is not None
+        self.assertEqual(cached.report, self.report)
+        self.assertAlmostEqual(cached.timestamp, time.time(), delta=60)
+
+    def test_key_mismatch(self) -> None:
+        write_cached_report(self.path, self.key, self.report)
+        self.assertIsNone(read_cached_report(
+            self.path, {'config-root': '/foo', 'fields': []}))
+
+    def test_missing(self) -> None:
+        self.assertIsNone(read_cached_report(self.path, self.key))
+
+    def test_invalid(self) -> None:
+        self.path.parent.mkdir()
+        for data in ('', '[]', json.dumps({'version': 1})):
+            with open(self.path, 'w') as f:
+                f.write(data)
+            self.assertIsNone(read_cached_report(self.path, self.key))
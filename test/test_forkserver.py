@@ -0,0 +1,119 @@
+# (c) 2020 Michał Górny
+# 2-clause BSD license
+
+"""Tests for batch report generation"""
+
+import os
+import shutil
+import typing
+
+from pathlib import Path
+
+from portage.repository.config import RepoConfigLoader
+
+from gander.background import Pacer
+from gander.forkserver import generate_reports, repos_conf_key
+from gander.report import PortageAPI
+
+from test.repo import EbuildRepositoryTestCase
+
+
+def report_func(root: Path,
+                repositories: typing.Optional[RepoConfigLoader]
+                ) -> typing.Dict[str, typing.Any]:
+    api = PortageAPI(config_root=root, repositories=repositories)
+    return {
+        'profile': api.profile,
+        'world': api.world,
+        'shared': repositories is not None,
+        'pid': os.getpid(),
+    }
+
+
+class GenerateReportsTests(EbuildRepositoryTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        for v in ('PORTDIR', 'PORTAGE_REPOSITORIES'):
+            os.environ.pop(v, None)
+        self.create(world=['dev-libs/foo', 'dev-libs/bar'])
+        self.create_vdb_package('dev-libs/foo-1')
+        self.root = Path(self.tempdir.name)
+
+    def clone_root(self,
+                   name: str,
+                   repos_conf: typing.Optional[str] = None
+                   ) -> Path:
+        root = self.root / name
+        for d in ('etc', 'var'):
+            shutil.copytree(self.root / d, root / d, symlinks=True)
+        os.unlink(root / 'etc/portage/make.profile')
+        self.create_profile_abs_symlink(
+            self.root / 'gentoo/profiles/default/linux/amd64',
+            root / 'etc/portage')
+        with open(root / 'etc/portage/make.conf', 'w') as f:
+            f.write(f'ROOT={repr(str(root))}\n')
+        if repos_conf is not None:
+            with open(root / 'etc/portage/repos.conf', 'w') as f:
+                f.write(repos_conf)
+        return root
+
+    def test_reports(self) -> None:
+        clone = self.clone_root('clone')
+        shutil.rmtree(clone / 'var/db/pkg/dev-libs/foo-1')
+        self.create_vdb_package('../../../clone/var/db/pkg/dev-libs/bar-1')
+        changed = self.clone_root(
+            'changed',
+            f'[gentoo]\nlocation = {self.root}/gentoo\n')
+        missing = self.root / 'missing'
+
+        results = list(generate_reports([self.root, clone, changed,
+                                         missing],
+                                        report_func,
+                                        template_root=self.root,
+                                        jobs=2))
+        self.assertEqual([r.root for r in results],
+                         [self.root, clone, changed, missing])
+        reports = [r.report for r in results]
+        self.assertEqual(
+            [(r['profile'], r['world'], r['shared'])
+             for r in reports if r is not None],
+            [('default/linux/amd64', ['dev-libs/foo'], True),
+             ('default/linux/amd64', ['dev-libs/bar'], True),
+             ('default/linux/amd64', ['dev-libs/foo'], False)])
+        self.assertIsNone(results[3].report)
+        self.assertIsNotNone(results[3].error)
+        # every root gets its own worker
+        self.assertEqual(len(set(r['pid'] for r in reports
+                                 if r is not None)), 3)
+        self.assertNotIn(os.getpid(), (r['pid'] for r in reports
+                                       if r is not None))
+
+    def test_pacer_stats(self) -> None:
+        clone = self.clone_root('clone')
+        pacer = Pacer()
+        pacer.steps = 10
+        pacer.throttled = 1.0
+
+        def paced_report_func(root: Path,
+                              repositories: typing.Optional[RepoConfigLoader]
+                              ) -> typing.Dict[str, typing.Any]:
+            pacer.steps += 2
+            pacer.throttled += 0.5
+            return {}
+
+        results = list(generate_reports([self.root, clone],
+                                        paced_report_func,
+                                        template_root=self.root,
+                                        jobs=1,
+                                        pacer=pacer))
+        self.assertEqual([(r.steps, r.throttled) for r in results],
+                         [(2, 0.5), (2, 0.5)])
+        self.assertEqual(pacer.steps, 14)
+        self.assertAlmostEqual(pacer.throttled, 2.0)
+
+    def test_repos_conf_key(self) -> None:
+        clone = self.clone_root('clone')
+        changed = self.clone_root('changed', '')
+        self.assertEqual(repos_conf_key(self.root), repos_conf_key(clone))
+        self.assertNotEqual(repos_conf_key(self.root),
+                            repos_conf_key(changed))
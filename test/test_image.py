@@ -0,0 +1,204 @@
+# (c) 2020 Michał Górny
+# 2-clause BSD license
+
+"""Tests for report generation from images"""
+
+import gzip
+import importlib.util
+import io
+import lzma
+import os
+import tarfile
+import typing
+import unittest
+
+from pathlib import Path
+
+from gander.image import ImageAPI, ImageFormatError, is_wanted
+
+from test.repo import EbuildRepositoryTestCase
+from test.squashfs import write_squashfs
+
+try:
+    import zstandard
+    HAVE_ZSTANDARD = True
+except ImportError:
+    HAVE_ZSTANDARD = False
+
+HAVE_SQUASHFS = importlib.util.find_spec('PySquashfsImage') is not None
+
+
+class IsWantedTests(unittest.TestCase):
+    def test_wanted(self) -> None:
+        for path in ('etc/portage/make.profile',
+                     'etc/portage/make.profile/parent',
+                     'etc/portage/sets/foo',
+                     'var/lib/portage/world',
+                     'var/lib/portage/world_sets',
+                     'var/db/pkg/dev-libs/foo-1/repository',
+                     'var/db/pkg/dev-libs/foo-1/SLOT',
+                     'var/db/pkg/dev-libs/foo-1/EAPI'):
+            self.assertTrue(is_wanted(path), path)
+
+    def test_unwanted(self) -> None:
+        for path in ('etc/portage/make.conf',
+                     'etc/portage/make.profile/make.defaults',
+                     'var/db/pkg/dev-libs/foo-1/CONTENTS',
+                     'var/db/pkg/dev-libs/repository',
+                     'usr/var/db/pkg/dev-libs/foo-1/SLOT'):
+            self.assertFalse(is_wanted(path), path)
+
+
+class ImageAPITests(EbuildRepositoryTestCase):
+    def create_image(self,
+                     compress: typing.Callable[[bytes], bytes]
+                     = bytes
+                     ) -> ImageAPI:
+        root = Path(self.tempdir.name)
+        image_path = root.parent / f'{root.name}.img'
+        self.addCleanup(os.unlink, image_path)
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode='w') as tar:
+            tar.add(root, arcname='.')
+        with open(image_path, 'wb') as f:
+            f.write(compress(buf.getvalue()))
+        return ImageAPI(image_path)
+
+    def create_squashfs_image(self) -> ImageAPI:
+        root = Path(self.tempdir.name)
+        image_path = root.parent / f'{root.name}.squashfs'
+        self.addCleanup(os.unlink, image_path)
+        write_squashfs(root, image_path)
+        return ImageAPI(image_path)
+
+    def test_profile_symlink(self) -> None:
+        self.create(profile_callback=self.create_profile_symlink)
+        self.assertEqual(self.create_image().profile,
+                         'default/linux/amd64')
+
+    def test_profile_directory_repo(self) -> None:
+        self.create(
+            profile_callback=self.create_profile_directory_repo)
+        self.assertEqual(self.create_image().profile,
+                         'default/linux/amd64')
+
+    def test_profile_directory_rel(self) -> None:
+        self.create(profile_callback=self.create_profile_directory_rel)
+        self.assertEqual(self.create_image().profile,
+                         'default/linux/amd64')
+
+    def test_profile_empty(self) -> None:
+        self.create(
+            profile_callback=self.create_profile_directory_empty)
+        self.assertIsNone(self.create_image().profile)
+
+    def test_profile_nongentoo(self) -> None:
+        self.create(profile_callback=self.create_profile_nongentoo)
+        self.assertIsNone(self.create_image().profile)
+
+    def assert_world(self,
+                     compress: typing.Callable[[bytes], bytes]
+                     = bytes
+                     ) -> None:
+        packages = [
+            'dev-libs/foo:3',
+            '<dev-libs/bar-4',
+            'dev-libs/baz',
+            'dev-util/frobnicate::gentoo',
+            'dev-util/missing',
+        ]
+        self.create(world=packages)
+        self.create_vdb_package('dev-libs/foo-3', SLOT='3')
+        self.create_vdb_package('dev-libs/bar-3')
+        self.create_vdb_package('dev-libs/baz-3', repository='fancy')
+        self.create_vdb_package('dev-util/frobnicate-1')
+        self.assertEqual(self.create_image(compress).world, [
+            'dev-libs/bar',
+            'dev-libs/foo',
+            'dev-util/frobnicate',
+        ])
+
+    def test_world(self) -> None:
+        self.assert_world()
+
+    def test_world_gz(self) -> None:
+        self.assert_world(gzip.compress)
+
+    def test_world_xz(self) -> None:
+        self.assert_world(lzma.compress)
+
+    @unittest.skipIf(not HAVE_ZSTANDARD, 'zstandard not available')
+    def test_world_zst(self) -> None:
+        self.assert_world(zstandard.ZstdCompressor().compress)
+
+    @unittest.skipIf(not HAVE_SQUASHFS, 'PySquashfsImage not available')
+    def test_squashfs(self) -> None:
+        self.create(world=['dev-libs/foo:3', 'dev-libs/baz'],
+                    profile_callback=self.create_profile_symlink)
+        root = Path(self.tempdir.name)
+        with open(root / 'var/lib/portage/world_sets', 'w') as f:
+            f.write('@mine\n')
+        with open(root / 'etc/portage/sets/mine', 'w') as f:
+            f.write('dev-libs/bar\n')
+        self.create_vdb_package('dev-libs/foo-3', SLOT='3', USE='b a\n')
+        self.create_vdb_package('dev-libs/foo-4', SLOT='4')
+        self.create_vdb_package('dev-libs/bar-1')
+        self.create_vdb_package('dev-libs/baz-3', repository='fancy')
+        api = self.create_squashfs_image()
+        self.assertEqual(api.profile, 'default/linux/amd64')
+        self.assertEqual(
+            api.get_world(['version', 'use']),
+            (['dev-libs/bar', 'dev-libs/foo'],
+             {'dev-libs/bar': [{'version': '1', 'use': []}],
+              'dev-libs/foo': [{'version': '3', 'use': ['a', 'b']}]}))
+
+    def test_world_extended(self) -> None:
+        self.create(world=['dev-libs/foo:3', 'dev-libs/baz'])
+        self.create_vdb_package('dev-libs/foo-3', SLOT='3', USE='b a\n')
+        self.create_vdb_package('dev-libs/foo-4', SLOT='4')
+        self.create_vdb_package('dev-libs/baz-3', repository='fancy')
+        self.assertEqual(
+            self.create_image().get_world(['version', 'use']),
+            (['dev-libs/foo'],
+             {'dev-libs/foo': [{'version': '3', 'use': ['a', 'b']}]}))
+
+    def test_world_slot_normalized(self) -> None:
+        self.create(world=['dev-libs/foo:2', 'dev-libs/bar'])
+        # sub-slot requires EAPI 5
+        self.create_vdb_package('dev-libs/foo-2', SLOT='2/1', EAPI='4')
+        self.create_vdb_package('dev-libs/bar-1', SLOT='')
+        self.assertEqual(
+            self.create_image().get_world(['slot']),
+            (['dev-libs/bar'],
+             {'dev-libs/bar': [{'slot': '0'}]}))
+
+    def test_world_sets(self) -> None:
+        self.create(world=['dev-libs/foo'])
+        root = Path(self.tempdir.name)
+        with open(root / 'var/lib/portage/world_sets', 'w') as f:
+            f.write('@mine\n@system\n')
+        sets: typing.Dict[str, str] = {
+            'mine': 'dev-libs/bar\n@nested\n',
+            'nested': '# comment\ndev-libs/baz\n@mine\n',
+        }
+        for name, data in sets.items():
+            with open(root / 'etc/portage/sets' / name, 'w') as f:
+                f.write(data)
+        for x in ('foo', 'bar', 'baz'):
+            self.create_vdb_package(f'dev-libs/{x}-1')
+        self.assertEqual(self.create_image().world, [
+            'dev-libs/bar',
+            'dev-libs/baz',
+            'dev-libs/foo',
+        ])
+
+    def test_world_empty(self) -> None:
+        self.create()
+        self.assertEqual(self.create_image().world, [])
+
+    def test_invalid_image(self) -> None:
+        root = Path(self.tempdir.name)
+        image_path = root / 'image'
+        with open(image_path, 'w') as f:
+            f.write('not an image')
+        self.assertRaises(ImageFormatError, ImageAPI, image_path)
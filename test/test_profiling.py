@@ -0,0 +1,95 @@
+# (c) 2020 Michał Górny
+# 2-clause BSD license
+
+"""Tests for the built-in profiler"""
+
+import pstats
+import signal
+import sys
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from gander.profiling import (Profiler,
+                              StackSampler,
+                              module_tag,
+                              )
+from gander.report import PortageAPI
+
+
+class FakeAPI(object):
+    def sample(self, sampler: StackSampler) -> None:
+        sampler.sample(signal.SIGPROF, sys._getframe())
+
+
+class ModuleTagTests(unittest.TestCase):
+    def test_tags(self) -> None:
+        self.assertEqual(
+            [module_tag(x) for x in ('gander.report',
+                                     'portage.dbapi.vartree',
+                                     '_emerge.main',
+                                     'json',
+                                     'gandertool')],
+            ['gander', 'portage', 'portage', 'other', 'other'])
+
+
+class StackSamplerTests(unittest.TestCase):
+    def test_sample(self) -> None:
+        sampler = StackSampler()
+        for i in range(2):
+            sampler.sample(signal.SIGPROF, sys._getframe())
+        self.assertEqual(len(sampler.stacks), 1)
+        stack, count = next(iter(sampler.stacks.items()))
+        self.assertEqual(count, 2)
+        self.assertRegex(stack[-1],
+                         r'^other:test\.test_profiling\.'
+                         r'(StackSamplerTests\.)?test_sample$')
+        self.assertEqual(sampler.leaf_tags, {'other': 2})
+
+    def test_sample_api(self) -> None:
+        sampler = StackSampler()
+        # pretend that FakeAPI.sample is a PortageAPI method
+        sampler.api_codes.add(FakeAPI.sample.__code__)
+        FakeAPI().sample(sampler)
+        stack, = sampler.stacks
+        self.assertEqual(stack[-1],
+                         'api:test.test_profiling.PortageAPI.sample')
+        self.assertEqual(sampler.leaf_tags, {'api': 1})
+
+    def test_api_codes(self) -> None:
+        sampler = StackSampler()
+        self.assertIn(PortageAPI.get_world.__code__, sampler.api_codes)
+        world = PortageAPI.__dict__['world']
+        self.assertIn(world.fget.__code__, sampler.api_codes)
+
+    def test_write_folded(self) -> None:
+        sampler = StackSampler()
+        sampler.stacks[('other:a', 'gander:b')] += 3
+        sampler.stacks[('other:a',)] += 1
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = Path(tempdir) / 'test.folded'
+            sampler.write_folded(path)
+            with open(path) as f:
+                self.assertEqual(f.read(),
+                                 'other:a 1\nother:a;gander:b 3\n')
+
+
+class ProfilerTests(unittest.TestCase):
+    def test_profile(self) -> None:
+        with Profiler() as profiler:
+            sum(x * x for x in range(100000))
+        self.assertIs(signal.getsignal(signal.SIGPROF), signal.SIG_DFL)
+        self.assertEqual(signal.getitimer(signal.ITIMER_PROF),
+                         (0.0, 0.0))
+        self.assertRegex(profiler.summary(),
+                         r'^api [0-9.]+ s \(\d+%\), \d+% samples; '
+                         r'gander .*; portage .*; other .*$')
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            paths = profiler.write(Path(tempdir) / 'prof')
+            self.assertEqual([p.name for p in paths],
+                             ['prof.pstats', 'prof.folded'])
+            stats = pstats.Stats(str(paths[0]))
+            self.assertGreater(stats.total_calls, 0)  # type: ignore
+            self.assertTrue(paths[1].exists())
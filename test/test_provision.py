@@ -0,0 +1,116 @@
+# (c) 2020 Michał Górny
+# 2-clause BSD license
+
+"""Tests for machine id provisioning"""
+
+import os
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from gander.privacy import PRIVACY_POLICY_VERSION
+from gander.provision import (MACHINE_ID_RE,
+                              get_policy_path,
+                              provision_roots,
+                              read_accepted_policy,
+                              read_machine_id,
+                              write_atomic,
+                              )
+
+
+class WriteAtomicTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tempdir.name) / 'subdir' / 'file'
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_write(self) -> None:
+        write_atomic(self.path, 'foo\n')
+        write_atomic(self.path, 'bar\n')
+        with open(self.path) as f:
+            self.assertEqual(f.read(), 'bar\n')
+        self.assertEqual(os.listdir(self.path.parent), ['file'])
+
+    def test_no_overwrite(self) -> None:
+        write_atomic(self.path, 'foo\n', overwrite=False)
+        self.assertRaises(FileExistsError,
+                          write_atomic, self.path, 'bar\n',
+                          overwrite=False)
+        with open(self.path) as f:
+            self.assertEqual(f.read(), 'foo\n')
+        self.assertEqual(os.listdir(self.path.parent), ['file'])
+
+
+class ProvisionRootsTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.roots = [Path(self.tempdir.name) / f'root{i}'
+                      for i in range(4)]
+        for root in self.roots:
+            os.mkdir(root)
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def id_path(self, root: Path) -> Path:
+        return root / 'etc' / 'gander.id'
+
+    def test_provision(self) -> None:
+        results = list(provision_roots(self.roots))
+        self.assertEqual([r.status for r in results], ['created'] * 4)
+        ids = set()
+        for r in results:
+            assert r.machine_id is not None
+            self.assertRegex(r.machine_id, MACHINE_ID_RE)
+            self.assertEqual(read_machine_id(self.id_path(r.root)),
+                             r.machine_id)
+            self.assertEqual(read_accepted_policy(self.id_path(r.root)),
+                             PRIVACY_POLICY_VERSION)
+            ids.add(r.machine_id)
+        self.assertEqual(len(ids), 4)
+
+    def test_existing_and_duplicate(self) -> None:
+        existing = '0123456789abcdef0123456789abcdef'
+        for root in self.roots[:2]:
+            write_atomic(self.id_path(root), f'{existing}\n')
+        write_atomic(self.id_path(self.roots[2]), 'invalid\n')
+        results = list(provision_roots(self.roots + self.roots[:1]))
+        self.assertEqual(
+            [r.status for r in results],
+            ['kept',
+             f'regenerated (duplicate of {self.roots[0]})',
+             'created',
+             'created',
+             'skipped (duplicate root)'])
+        self.assertEqual(results[0].machine_id, existing)
+        self.assertNotEqual(results[1].machine_id, existing)
+        self.assertEqual(read_machine_id(self.id_path(self.roots[1])),
+                         results[1].machine_id)
+        self.assertEqual(read_machine_id(self.id_path(self.roots[2])),
+                         results[2].machine_id)
+
+    def test_failure(self) -> None:
+        with open(self.roots[0] / 'etc', 'w'):
+            pass
+        results = list(provision_roots(self.roots[:2]))
+        self.assertIsNone(results[0].machine_id)
+        self.assertTrue(results[0].status.startswith('failed:'))
+        self.assertEqual(results[1].status, 'created')
+
+    def test_missing_root(self) -> None:
+        missing = Path(self.tempdir.name) / 'missing'
+        os.rmdir(self.roots[0])
+        with open(self.roots[0], 'w'):
+            pass
+        results = list(provision_roots([missing, self.roots[0]]))
+        for r in results:
+            self.assertIsNone(r.machine_id)
+            self.assertTrue(r.status.startswith('failed:'))
+        self.assertFalse(missing.exists())
+
+    def test_policy_path(self) -> None:
+        self.assertEqual(get_policy_path(Path('/etc/gander.id')),
+                         Path('/etc/gander.policy'))
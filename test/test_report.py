@@ -6,9 +6,14 @@
 from pathlib import Path
 
 import os
+import shutil
 import typing
 
+from unittest.mock import MagicMock, call
+
+from gander.background import Pacer
 from gander.report import PortageAPI
+from gander.vdbindex import rebuild_index
 
 from test.repo import EbuildRepositoryTestCase
 
@@ -114,3 +119,114 @@ class PortageAPITests(EbuildRepositoryTestCase):
         self.create(world=packages)
         self.create_vdb_package('dev-libs/foo-3')
         self.assertEqual(self.api.world, [])
+
+    def test_world_extended(self) -> None:
+        packages = [
+            'dev-libs/foo:3',
+            'dev-libs/foo:4/7',
+            'dev-libs/bar',
+        ]
+        self.create(world=packages)
+        self.create_vdb_package('dev-libs/foo-3', SLOT='3', USE='a')
+        self.create_vdb_package('dev-libs/foo-4-r1', SLOT='4/7',
+                                USE='b a', EAPI='7')
+        self.create_vdb_package('dev-libs/bar-1', SLOT='0', USE='')
+        self.assertEqual(
+            self.api.get_world(['version', 'slot', 'use']),
+            (['dev-libs/bar', 'dev-libs/foo'],
+             {'dev-libs/bar': [
+                 {'version': '1', 'slot': '0', 'use': []},
+              ],
+              'dev-libs/foo': [
+                 {'version': '3', 'slot': '3', 'use': ['a']},
+                 {'version': '4-r1', 'slot': '4/7', 'use': ['a', 'b']},
+              ]}))
+
+    def test_world_extended_none(self) -> None:
+        self.create(world=['dev-libs/foo'])
+        self.create_vdb_package('dev-libs/foo-3')
+        self.assertEqual(self.api.get_world(),
+                         (['dev-libs/foo'], {}))
+
+    def test_world_paced(self) -> None:
+        self.create(world=['dev-libs/foo', 'dev-libs/bar'])
+        self.create_vdb_package('dev-libs/foo-1')
+        pacer = MagicMock(spec=Pacer)
+        self.api.pacer = pacer
+        self.assertEqual(self.api.world, ['dev-libs/foo'])
+        self.assertEqual(pacer.mock_calls, [call.start(), call(), call()])
+
+    def test_world_vdb_index(self) -> None:
+        self.create(world=['dev-libs/foo', 'dev-libs/bar'])
+        self.create_vdb_package('dev-libs/foo-1')
+        self.create_vdb_package('dev-libs/bar-1')
+        self.create_vdb_package('dev-libs/bar-2', repository='fancy')
+        os.makedirs(self.api.eroot / 'var/cache/edb')
+        with open(self.api.eroot / 'var/cache/edb/counter', 'w') as f:
+            f.write('3')
+        rebuild_index(self.api.eroot)
+        self.assertEqual(self.api.get_indexed_world(),
+                         ['dev-libs/foo'])
+        self.assertEqual(self.api.world, ['dev-libs/foo'])
+
+        # index used rather than the vdb
+        with open(Path(self.tempdir.name) / 'var/db/pkg/dev-libs/bar-2'
+                  / 'repository', 'w') as f:
+            f.write('gentoo')
+        self.assertEqual(self.api.world, ['dev-libs/foo'])
+
+        # extended data requires the vdb
+        self.assertEqual(self.api.get_world(['version'])[0],
+                         ['dev-libs/bar', 'dev-libs/foo'])
+
+    def test_world_vdb_index_stale(self) -> None:
+        self.create(world=['dev-libs/foo', 'dev-libs/bar'])
+        self.create_vdb_package('dev-libs/foo-1')
+        self.create_vdb_package('dev-libs/bar-1')
+        os.makedirs(self.api.eroot / 'var/cache/edb')
+        with open(self.api.eroot / 'var/cache/edb/counter', 'w') as f:
+            f.write('3')
+        rebuild_index(self.api.eroot)
+        # unmerged without running the hook
+        vdb = Path(self.tempdir.name) / 'var/db/pkg'
+        shutil.rmtree(vdb / 'dev-libs/bar-1')
+        # Portage bumps the vdb mtime
+        mtime = vdb.stat().st_mtime_ns + 10**9
+        os.utime(vdb, ns=(mtime, mtime))
+        self.assertIsNone(self.api.get_indexed_world())
+        self.assertEqual(self.api.world, ['dev-libs/foo'])
+
+    def test_world_scanned(self) -> None:
+        self.create(world=['dev-libs/foo:3',
+                           '<dev-libs/bar-4',
+                           'dev-libs/baz',
+                           'dev-libs/qux::fancy',
+                           'app-misc/missing',
+                           'dev-util/frobnicate'])
+        self.create_vdb_package('dev-libs/foo-3', SLOT='3', EAPI='7')
+        self.create_vdb_package('dev-libs/foo-4', SLOT='4/7', EAPI='7')
+        self.create_vdb_package('dev-libs/foo-5', SLOT='3/1', EAPI='4')
+        self.create_vdb_package('dev-libs/bar-3', USE='b a')
+        self.create_vdb_package('dev-libs/bar-5')
+        # sub-slot requires EAPI 5
+        self.create_vdb_package('dev-libs/bar-6', SLOT='6/1')
+        self.create_vdb_package('dev-libs/baz-3', repository='fancy')
+        self.create_vdb_package('dev-libs/qux-1')
+        self.create_vdb_package('dev-util/frobnicate-1')
+        self.create_vdb_package('dev-util/-MERGING-frobnicate-2')
+        self.create_vdb_package('sys-apps/unrelated-1')
+        for fields in ([], ['version', 'slot', 'use']):
+            self.assertEqual(self.api.get_scanned_world(4, fields),
+                             self.api.get_world(fields))
+        self.assertEqual(self.api.get_scanned_world(1)[0],
+                         ['dev-libs/bar', 'dev-libs/foo',
+                          'dev-util/frobnicate'])
+
+    def test_world_scanned_paced(self) -> None:
+        self.create(world=['dev-libs/foo', 'dev-libs/bar'])
+        self.create_vdb_package('dev-libs/foo-1')
+        pacer = MagicMock(spec=Pacer)
+        self.api.pacer = pacer
+        self.api.scan_jobs = 2
+        self.assertEqual(self.api.world, ['dev-libs/foo'])
+        self.assertEqual(pacer.mock_calls, [call.start(), call()])
@@ -0,0 +1,162 @@
+# (c) 2020 Michał Górny
+# 2-clause BSD license
+
+"""Tests for report submission"""
+
+import importlib.util
+import itertools
+import json
+import socket
+import typing
+import unittest
+
+from unittest.mock import patch
+
+from requests.adapters import HTTPAdapter
+from requests.models import PreparedRequest
+import requests
+import requests.adapters
+import responses
+
+from gander.submission import (get_failure_hint,
+                               get_proxies,
+                               submit_reports,
+                               )
+
+
+HAVE_SOCKS = importlib.util.find_spec('socks') is not None
+
+URL = 'http://example.com/submit'
+
+STATUSES = {
+    '00000000000000000000000000000000': 200,
+    '11111111111111111111111111111111': 429,
+    '22222222222222222222222222222222': 413,
+    '33333333333333333333333333333333': 503,
+    '44444444444444444444444444444444': 400,
+}
+
+
+def reply(request: PreparedRequest
+          ) -> typing.Tuple[int, typing.Dict[str, str], str]:
+    data = json.loads(typing.cast(bytes, request.body))
+    assert request.headers['User-Agent'] == 'gander'
+    return (STATUSES[data['id']], {}, 'Bad\nrequest')
+
+
+class GetFailureHintTests(unittest.TestCase):
+    def test_hints(self) -> None:
+        data: typing.Dict[str, typing.Any] = {'world': []}
+        self.assertIn('try again', get_failure_hint(500, data) or '')
+        self.assertIn('7 days', get_failure_hint(429, data) or '')
+        self.assertIn('0.00 MiB', get_failure_hint(413, data) or '')
+        self.assertIn('API endpoint', get_failure_hint(404, data) or '')
+        self.assertIsNone(get_failure_hint(400, data))
+
+
+class GetProxiesTests(unittest.TestCase):
+    def test_no_tor(self) -> None:
+        self.assertEqual(get_proxies('https', False), {})
+
+    def test_tor(self) -> None:
+        self.assertRegex(get_proxies('https', True)['https'],
+                         r'^socks5h://gander[0-9a-f]{4}@localhost:9050$')
+
+
+class SubmitReportsTests(unittest.TestCase):
+    @responses.activate
+    def test_submit(self) -> None:
+        responses.add_callback('PUT', URL, callback=reply)
+        lines = [json.dumps({'id': machine_id, 'world': []}) + '\n'
+                 for machine_id in STATUSES]
+        lines.insert(2, '\n')
+        lines.append('{"id": "invalid"}\n')
+        lines.append('not json\n')
+
+        results = list(submit_reports(URL, lines, jobs=2))
+        self.assertEqual(
+            [(r.lineno, r.status_code, r.accepted) for r in results],
+            [(1, 200, True),
+             (2, 429, False),
+             (4, 413, False),
+             (5, 503, False),
+             (6, 400, False),
+             (7, None, False),
+             (8, None, False),
+             ])
+        self.assertEqual(
+            [r.machine_id for r in results],
+            list(STATUSES) + [None, None])
+        self.assertEqual(results[0].message, 'accepted')
+        self.assertIn('7 days', results[1].message)
+        self.assertIn('size limit. Please file', results[2].message)
+        self.assertIn('try again', results[3].message)
+        self.assertEqual(results[4].message, 'rejected: Bad request')
+        self.assertIn('invalid machine id', results[5].message)
+        self.assertTrue(results[6].message.startswith('invalid report'))
+        self.assertEqual(len(responses.calls), 5)
+
+    @responses.activate
+    @patch.dict('os.environ', {'HTTP_PROXY': 'http://proxy.example.com',
+                               'HTTPS_PROXY': 'http://proxy.example.com'})
+    def test_tor(self) -> None:
+        responses.add('PUT', URL, status=200)
+        lines = [json.dumps({'id': machine_id}) for machine_id in STATUSES]
+        results = list(submit_reports(URL, lines, jobs=2, tor=True))
+        self.assertTrue(all(r.accepted for r in results))
+        proxies = [typing.cast(typing.Any, c.request).req_kwargs['proxies']
+                   for c in responses.calls]
+        # tor takes precedence over proxies from the environment
+        for p in proxies:
+            self.assertRegex(p['http'], r'^socks5h://gander[0-9a-f]{4}@')
+        # at most one circuit per worker thread
+        self.assertLessEqual(len(set(p['http'] for p in proxies)), 2)
+
+    @unittest.skipIf(not HAVE_SOCKS, 'PySocks not available')
+    def test_tor_proxy_managers(self) -> None:
+        # route via a closed port, so that connections fail quickly
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        routes = itertools.count()
+        adapters: typing.List[requests.adapters.HTTPAdapter] = []
+
+        def get_proxies(scheme: str,
+                        tor: bool
+                        ) -> typing.Dict[str, str]:
+            return {scheme: f'socks5h://gander{next(routes)}'
+                            f'@127.0.0.1:{port}'}
+
+        def create_adapter(**kwargs: typing.Any
+                           ) -> requests.adapters.HTTPAdapter:
+            adapters.append(HTTPAdapter(**kwargs))
+            return adapters[-1]
+
+        lines = [json.dumps({'id': f'{i:032x}'}) for i in range(20)]
+        with patch('gander.submission.get_proxies', get_proxies), \
+                patch('gander.submission.requests.adapters.HTTPAdapter',
+                      create_adapter):
+            results = list(submit_reports(URL, lines, jobs=2, tor=True))
+        self.assertEqual(len(results), 20)
+        self.assertFalse(any(r.accepted for r in results))
+        # one proxy manager (and connection pool) per worker thread
+        self.assertLessEqual(len(adapters[0].proxy_manager), 2)
+
+    @responses.activate
+    def test_request_error(self) -> None:
+        responses.add('PUT', URL, body=requests.TooManyRedirects('loop'))
+        responses.add('PUT', URL, status=200)
+        lines = [json.dumps({'id': machine_id})
+                 for machine_id in list(STATUSES)[:2]]
+        results = list(submit_reports(URL, lines, jobs=1))
+        self.assertEqual([r.status_code for r in results], [None, 200])
+        self.assertEqual(results[0].message, 'submission failed: loop')
+
+    @responses.activate
+    def test_connection_error(self) -> None:
+        results = list(submit_reports(
+            URL, ['{"id": "00000000000000000000000000000000"}'], jobs=1))
+        self.assertEqual(len(results), 1)
+        self.assertIsNone(results[0].status_code)
+        self.assertTrue(
+            results[0].message.startswith('submission failed: '))
@@ -0,0 +1,199 @@
+# (c) 2020 Michał Górny
+# 2-clause BSD license
+
+"""Tests for the vdb index"""
+
+import os
+import tempfile
+import typing
+import unittest
+
+from pathlib import Path
+from unittest.mock import patch
+
+from gander.vdbindex import (BASHRC_HOOK,
+                             COUNTER_PATH,
+                             HookConflict,
+                             INDEX_PATH,
+                             install_hook,
+                             read_index,
+                             read_installed,
+                             rebuild_index,
+                             update_index,
+                             )
+
+
+class VdbIndexTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.eroot = Path(self.tempdir.name)
+        self.counter = 0
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def merge(self,
+              cpv: str,
+              slot: typing.Optional[str] = '0',
+              repo: typing.Optional[str] = 'gentoo'
+              ) -> None:
+        """Simulate Portage merging a package"""
+        self.counter += 1
+        self.write(COUNTER_PATH, str(self.counter))
+        vdir = f'var/db/pkg/{cpv}'
+        self.write(f'{vdir}/COUNTER', str(self.counter))
+        if slot is not None:
+            self.write(f'{vdir}/SLOT', f'{slot}\n')
+        self.write(f'{vdir}/EAPI', '7\n')
+        if repo is not None:
+            self.write(f'{vdir}/repository', f'{repo}\n')
+        self.bump_mtime()
+
+    def unmerge(self, cpv: str) -> None:
+        """Simulate Portage unmerging a package"""
+        vdir = self.eroot / 'var/db/pkg' / cpv
+        for f in os.listdir(vdir):
+            os.unlink(vdir / f)
+        os.rmdir(vdir)
+        self.bump_mtime()
+
+    def bump_mtime(self) -> None:
+        """Bump the vdb mtime, like Portage does after every change"""
+        vdb = self.eroot / 'var/db/pkg'
+        mtime = vdb.stat().st_mtime_ns + 10**9
+        os.utime(vdb, ns=(mtime, mtime))
+
+    def write(self, path: str, data: str) -> None:
+        path_ = self.eroot / path
+        os.makedirs(path_.parent, exist_ok=True)
+        with open(path_, 'w') as f:
+            f.write(data)
+
+    def installed(self) -> typing.Optional[typing.List[
+            typing.Tuple[str, str, str]]]:
+        ret = read_installed(self.eroot)
+        if ret is None:
+            return None
+        return sorted((str(p), p.slot, p.repo) for p in ret)
+
+    def test_rebuild(self) -> None:
+        self.merge('dev-libs/foo-1')
+        self.merge('dev-libs/bar-2', slot='2/2.1', repo='fancy')
+        self.merge('dev-util/baz-3', slot=None, repo=None)
+        os.makedirs(self.eroot / 'var/db/pkg/dev-libs/-MERGING-foo-2')
+        os.makedirs(self.eroot / 'var/db/pkg/dev-libs/.keep')
+        index = rebuild_index(self.eroot)
+        self.assertEqual(index.counter, 3)
+        self.assertEqual(self.installed(), [
+            ('dev-libs/bar-2', '2', 'fancy'),
+            ('dev-libs/foo-1', '0', 'gentoo'),
+            ('dev-util/baz-3', '0', '__unknown__'),
+        ])
+
+    def test_missing(self) -> None:
+        self.assertIsNone(read_installed(self.eroot))
+
+    def test_inconsistent(self) -> None:
+        self.merge('dev-libs/foo-1')
+        rebuild_index(self.eroot)
+        # merged without running the hook
+        self.merge('dev-libs/bar-1')
+        self.assertIsNone(read_installed(self.eroot))
+
+    def test_unmerged_without_hook(self) -> None:
+        self.merge('dev-libs/foo-1')
+        self.merge('dev-libs/bar-1')
+        rebuild_index(self.eroot)
+        self.unmerge('dev-libs/bar-1')
+        self.assertIsNone(read_installed(self.eroot))
+
+    def test_verified_mtime(self) -> None:
+        self.merge('dev-libs/foo-1')
+        rebuild_index(self.eroot)
+        self.merge('dev-libs/foo-2')
+        update_index(self.eroot, 'dev-libs/foo-2')
+        # Portage bumps the vdb mtime after running the hook
+        self.bump_mtime()
+        expected = [
+            ('dev-libs/foo-1', '0', 'gentoo'),
+            ('dev-libs/foo-2', '0', 'gentoo'),
+        ]
+        self.assertEqual(self.installed(), expected)
+        index = read_index(self.eroot / INDEX_PATH)
+        assert index is not None
+        self.assertEqual(index.verified_mtime,
+                         (self.eroot / 'var/db/pkg').stat().st_mtime_ns)
+        # the vdb is not listed again until it changes
+        with patch('gander.vdbindex.verify_index') as verify_index:
+            self.assertEqual(self.installed(), expected)
+            verify_index.assert_not_called()
+
+    def test_update(self) -> None:
+        self.merge('dev-libs/foo-1')
+        rebuild_index(self.eroot)
+        self.merge('dev-libs/foo-2')
+        update_index(self.eroot, 'dev-libs/foo-2')
+        self.unmerge('dev-libs/foo-1')
+        update_index(self.eroot, 'dev-libs/foo-1', removed=True)
+        self.merge('dev-libs/bar-1', repo='fancy')
+        update_index(self.eroot, 'dev-libs/bar-1')
+        self.assertEqual(self.installed(), [
+            ('dev-libs/bar-1', '0', 'fancy'),
+            ('dev-libs/foo-2', '0', 'gentoo'),
+        ])
+
+    def test_update_missed_merge(self) -> None:
+        self.merge('dev-libs/foo-1')
+        rebuild_index(self.eroot)
+        # merged without running the hook
+        self.merge('dev-libs/bar-1')
+        self.merge('dev-libs/foo-2')
+        update_index(self.eroot, 'dev-libs/foo-2')
+        self.assertEqual(self.installed(), [
+            ('dev-libs/bar-1', '0', 'gentoo'),
+            ('dev-libs/foo-1', '0', 'gentoo'),
+            ('dev-libs/foo-2', '0', 'gentoo'),
+        ])
+
+    def test_update_no_index(self) -> None:
+        self.merge('dev-libs/foo-1')
+        update_index(self.eroot, 'dev-libs/foo-1')
+        self.assertEqual(self.installed(), [
+            ('dev-libs/foo-1', '0', 'gentoo'),
+        ])
+
+    def test_remove_no_index(self) -> None:
+        update_index(self.eroot, 'dev-libs/foo-1', removed=True)
+        self.assertIsNone(read_index(self.eroot / INDEX_PATH))
+
+
+class InstallHookTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.bashrc = Path(self.tempdir.name) / 'bashrc'
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def read(self) -> str:
+        with open(self.bashrc) as f:
+            return f.read()
+
+    def test_new(self) -> None:
+        install_hook(self.bashrc)
+        self.assertEqual(self.read(), BASHRC_HOOK)
+
+    def test_append_and_replace(self) -> None:
+        with open(self.bashrc, 'w') as f:
+            f.write('pre_pkg_setup() {\n\t:\n}\n')
+        install_hook(self.bashrc)
+        expected = 'pre_pkg_setup() {\n\t:\n}\n\n' + BASHRC_HOOK
+        self.assertEqual(self.read(), expected)
+        install_hook(self.bashrc)
+        self.assertEqual(self.read(), expected)
+
+    def test_conflict(self) -> None:
+        with open(self.bashrc, 'w') as f:
+            f.write('function post_pkg_postinst {\n\t:\n}\n')
+        with self.assertRaises(HookConflict):
+            install_hook(self.bashrc)
@@ -0,0 +1,73 @@
+# (c) 2020 Michał Górny
+# 2-clause BSD license
+
+"""Tests for the parallel vdb scanner"""
+
+import os
+import tempfile
+import unittest
+
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from gander.background import Pacer
+from gander.vdbscan import scan_vdb
+
+
+class ScanVdbTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.vdb = Path(self.tempdir.name)
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def create(self, cpv: str, **kwargs: str) -> None:
+        os.makedirs(self.vdb / cpv)
+        for k, v in kwargs.items():
+            with open(self.vdb / cpv / k, 'w') as f:
+                f.write(f'{v}\n')
+
+    def test_scan(self) -> None:
+        self.create('dev-libs/foo-1', SLOT='0', repository='gentoo')
+        self.create('dev-libs/foo-2', SLOT='2/2.1', repository='fancy',
+                    USE='a b', EAPI='7')
+        self.create('dev-libs/foobar-1', SLOT='0', repository='gentoo')
+        self.create('dev-libs/-MERGING-foo-3', SLOT='0')
+        self.create('dev-libs/.keep')
+        self.create('dev-util/bar-1')
+        self.create('sys-apps/baz-1', SLOT='0')
+        with open(self.vdb / 'dev-libs' / 'stray-file', 'w'):
+            pass
+
+        installed = scan_vdb(self.vdb,
+                             ['dev-libs/foo', 'dev-util/bar',
+                              'app-misc/missing'],
+                             ['SLOT', 'repository', 'USE'],
+                             jobs=4)
+        self.assertEqual(
+            sorted((str(p), p.slot, p.repo, m)
+                   for p, m in installed.items()),
+            [('dev-libs/foo-1', '0', 'gentoo',
+              {'SLOT': '0', 'repository': 'gentoo'}),
+             ('dev-libs/foo-2', '2', 'fancy',
+              {'SLOT': '2/2.1', 'repository': 'fancy', 'USE': 'a b'}),
+             ('dev-util/bar-1', '0', '__unknown__', {'SLOT': '0'}),
+             ])
+
+    def test_paced(self) -> None:
+        self.create('dev-libs/foo-1', SLOT='0', repository='gentoo')
+        self.create('dev-libs/foo-2', SLOT='2', repository='gentoo')
+        self.create('dev-libs/bar-1', SLOT='0', repository='gentoo')
+        pacer = MagicMock(spec=Pacer)
+        installed = scan_vdb(self.vdb, ['dev-libs/foo'],
+                             ['SLOT', 'repository'], jobs=4, pacer=pacer)
+        self.assertEqual(sorted(str(p) for p in installed),
+                         ['dev-libs/foo-1', 'dev-libs/foo-2'])
+        # called once for every package read
+        self.assertEqual(pacer.call_count, 2)
+
+    def test_empty(self) -> None:
+        self.assertEqual(scan_vdb(self.vdb / 'missing',
+                                  ['dev-libs/foo'], ['SLOT'], jobs=2),
+                         {})
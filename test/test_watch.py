@@ -0,0 +1,96 @@
+# (c) 2020 Michał Górny
+# 2-clause BSD license
+
+"""Tests for watch mode"""
+
+import os
+import shutil
+import typing
+import unittest
+
+from pathlib import Path
+
+from gander.watch import ReportWatcher, package_key
+
+from test.repo import EbuildRepositoryTestCase
+
+
+class PackageKeyTests(unittest.TestCase):
+    def test_package(self) -> None:
+        self.assertEqual(package_key('dev-libs', 'foo-1.2-r1'),
+                         'dev-libs/foo')
+
+    def test_merging(self) -> None:
+        self.assertEqual(package_key('dev-libs', '-MERGING-foo-1'),
+                         'dev-libs/foo')
+
+    def test_invalid(self) -> None:
+        self.assertIsNone(package_key('dev-libs', 'foo'))
+
+
+class ReportWatcherTests(EbuildRepositoryTestCase):
+    def create(self,
+               profile_callback: typing.Optional[typing.Callable[
+                                 [Path, Path], None]] = None,
+               world: typing.Iterable[str] = []
+               ) -> None:
+        super().create(profile_callback, world)
+        for v in ('PORTDIR', 'PORTAGE_REPOSITORIES'):
+            os.environ.pop(v, None)
+        os.makedirs(Path(self.tempdir.name) / 'var' / 'db' / 'pkg')
+        self.watcher = ReportWatcher(config_root=Path(self.tempdir.name))
+        self.addCleanup(self.watcher.inotify.close)
+        self.watcher.add_watches()
+
+    def write_world(self, world: typing.Iterable[str]) -> None:
+        varport = Path(self.tempdir.name) / 'var' / 'lib' / 'portage'
+        with open(varport / 'world.tmp', 'w') as f:
+            f.write('\n'.join(world))
+        os.rename(varport / 'world.tmp', varport / 'world')
+
+    def test_initial(self) -> None:
+        self.create(world=['dev-libs/foo', 'dev-libs/bar'])
+        self.assertEqual(self.watcher.profile, 'default/linux/amd64')
+        self.assertEqual(self.watcher.world, [])
+
+    def test_merge(self) -> None:
+        self.create(world=['dev-libs/foo', 'dev-util/bar'])
+        self.create_vdb_package('dev-libs/foo-1')
+        self.watcher.process_events()
+        self.assertEqual(self.watcher.world, ['dev-libs/foo'])
+        self.create_vdb_package('dev-util/bar-1')
+        self.watcher.process_events()
+        self.assertEqual(self.watcher.world,
+                         ['dev-libs/foo', 'dev-util/bar'])
+
+    def test_unmerge(self) -> None:
+        self.create(world=['dev-libs/foo', 'dev-libs/bar'])
+        self.create_vdb_package('dev-libs/foo-1')
+        self.create_vdb_package('dev-libs/bar-1')
+        self.watcher.process_events()
+        self.assertEqual(self.watcher.world,
+                         ['dev-libs/bar', 'dev-libs/foo'])
+        shutil.rmtree(Path(self.tempdir.name) / 'var' / 'db' / 'pkg'
+                      / 'dev-libs' / 'foo-1')
+        self.watcher.process_events()
+        self.assertEqual(self.watcher.world, ['dev-libs/bar'])
+
+    def test_world_change(self) -> None:
+        self.create(world=['dev-libs/foo'])
+        self.create_vdb_package('dev-libs/foo-1')
+        self.create_vdb_package('dev-libs/bar-1')
+        self.watcher.process_events()
+        self.write_world(['dev-libs/bar'])
+        self.watcher.process_events()
+        self.assertEqual(self.watcher.world, ['dev-libs/bar'])
+
+    def test_profile_change(self) -> None:
+        self.create()
+        os.unlink(Path(self.tempdir.name) / 'etc' / 'portage'
+                  / 'make.profile')
+        self.create_profile_nongentoo(
+            Path(self.tempdir.name) / 'gentoo' / 'profiles' / 'default'
+            / 'linux' / 'amd64',
+            Path(self.tempdir.name) / 'etc' / 'portage')
+        self.watcher.process_events()
+        self.assertIsNone(self.watcher.profile)